@@ -1,10 +1,11 @@
 from __future__ import absolute_import
 from .grid_position import GridPosition
 from .rock_action import RockAction
+from .rock_belief import RockBelief
 from .rock_model import RockModel
 from .rock_observation import RockObservation
 from .rock_state import RockState
 from .rock_position_history import RockData, PositionAndRockData
 
-__all__ = ['grid_position', 'rock_action', 'rock_model', 'rock_observation', 'rock_position_history',
+__all__ = ['grid_position', 'rock_action', 'rock_belief', 'rock_model', 'rock_observation', 'rock_position_history',
            'rock_state']
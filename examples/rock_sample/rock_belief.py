@@ -0,0 +1,50 @@
+from __future__ import division
+from builtins import object
+import numpy as np
+from .rock_state import RockState
+
+
+class RockBelief(object):
+    """
+    Exact factored belief for RockSample: the position of the robot is known, and each rock is good
+    independently of the others with probability p_good[rock_no]
+    """
+
+    def __init__(self, grid_position, p_good):
+        self.position = grid_position
+        self.p_good = np.array(p_good, dtype=float)
+
+    def copy(self):
+        return RockBelief(self.position.copy(), self.p_good)
+
+    def sample_rocks(self, n_samples):
+        """
+        :param n_samples:
+        :return: np.array of n_samples rock bitmasks
+        """
+        good = np.random.random((n_samples, self.p_good.__len__())) < self.p_good
+        return good.dot(np.left_shift(1, np.arange(self.p_good.__len__(), dtype=np.int64)))
+
+    def sample_states(self, n_samples):
+        """
+        Sample states in the batch representation of RockModel.encode_states
+        :param n_samples:
+        :return: np.array of shape (n_samples, 3)
+        """
+        batch = np.empty((n_samples, 3), dtype=np.int64)
+        batch[:, 0] = self.position.i
+        batch[:, 1] = self.position.j
+        batch[:, 2] = self.sample_rocks(n_samples)
+        return batch
+
+    def sample_particles(self, n_samples):
+        """
+        :param n_samples:
+        :return: list of n_samples RockStates
+        """
+        n_rocks = self.p_good.__len__()
+        return [RockState.from_value(RockState.pack(self.position.i, self.position.j, rocks), n_rocks)
+                for rocks in self.sample_rocks(n_samples)]
+
+    def to_string(self):
+        return self.position.to_string() + ' - P(good) = ' + str(self.p_good)
@@ -9,13 +9,14 @@ from past.utils import old_div
 import logging
 import json
 import numpy as np
-from pomdpy.util import console, config_parser
+from pomdpy.util import console, config_parser, lock_for
 from .grid_position import GridPosition
 from .rock_state import RockState
+from .rock_belief import RockBelief
 from .rock_action import RockAction, ActionType
-from .rock_observation import RockObservation
+from .rock_observation import RockObservation, ObservationCode
 from pomdpy.discrete_pomdp import DiscreteActionPool, DiscreteObservationPool
-from pomdpy.pomdp import Model, StepResult
+from pomdpy.pomdp import Model, StepResult, StepResultBatch, ParticleSet
 from .rock_position_history import RockData, PositionAndRockData
 
 module = "RockModel"
@@ -59,6 +60,7 @@ class RockModel(Model):
         self.any_good_rocks = False
 
         # ------------- Data Collection ---------- #
+        # The sample counters are updated under lock_for(self), as tree-parallel workers share the model
         self.unique_rocks_sampled = []
         self.num_times_sampled = 0.0
         self.good_samples = 0.0
@@ -87,11 +89,29 @@ class RockModel(Model):
         # The environment map in vector form.
         # List of lists of RSCellTypes
         self.env_map = []
-
-        # The distance from each cell to the nearest goal square.
+        # The environment map as an array of RSCellTypes, and the coordinates of the rocks as an array,
+        # for the batched generative model
+        self.cell_types = None
+        self.rock_coordinates = None
+
+        # -------------- Per-cell tables ----------- #
+        # Indexed by [row, column], see initialize_tables
+        # The legal actions from each cell, as lists of action bin numbers and as a mask over action bin numbers
+        self.legal_actions = []
+        self.legal_action_masks = None
+        # The cell reached by each action, or the cell itself if the action is illegal
+        self.next_cells = None
+        # The accuracy of checking each rock
+        self.check_accuracy = None
+
+        # The number of moves on the shortest path from each cell to the nearest goal square.
         self.goal_distances = []
         # The distance from each cell to each rock.
         self.rock_distances = []
+        # The discount of the reward for sampling each rock at the end of the shortest path to it from each
+        # cell, and of the exit reward at the end of the shortest path to the exit, for the DESPOT value bounds
+        self.sample_discounts = None
+        self.exit_discounts = None
 
         # Smart rock data
         self.all_rock_data = []
@@ -117,26 +137,82 @@ class RockModel(Model):
                 # initialized to empty
                 cell_type = RSCellType.EMPTY
 
-                if c is 'o':
+                if c == 'o':
                     self.rock_positions.append(p.copy())
                     cell_type = RSCellType.ROCK + self.n_rocks
                     self.n_rocks += 1
-                elif c is 'G':
+                elif c == 'G':
                     cell_type = RSCellType.GOAL
                     self.goal_positions.append(p.copy())
-                elif c is 'S':
+                elif c == 'S':
                     self.start_position = p.copy()
                     cell_type = RSCellType.EMPTY
-                elif c is 'X':
+                elif c == 'X':
                     cell_type = RSCellType.OBSTACLE
                 tmp.append(cell_type)
 
             self.env_map.append(tmp)
+        self.cell_types = np.array(self.env_map, dtype=np.int64)
+        self.rock_coordinates = np.array([[pos.i, pos.j] for pos in self.rock_positions], dtype=np.int64).reshape(-1, 2)
+        self.initialize_tables()
         # Total number of distinct states
         self.num_states = pow(2, self.n_rocks)
         self.min_val = old_div(-self.illegal_move_penalty, (1 - self.discount))
         self.max_val = self.good_rock_reward * self.n_rocks + self.exit_reward
 
+    def initialize_tables(self):
+        """
+        Precompute, for every cell of the map, the legal actions, the cell reached by each action, the
+        distances to the nearest goal square and to each rock, the accuracy of checking each rock, and the
+        discounts of the earliest rewards for sampling each rock and for exiting
+        """
+        n_actions = 5 + self.n_rocks
+        self.legal_actions = [[self.make_legal_actions(GridPosition(i, j)) for j in range(0, self.n_cols)]
+                              for i in range(0, self.n_rows)]
+        self.legal_action_masks = np.zeros((self.n_rows, self.n_cols, n_actions), dtype=bool)
+        for i in range(0, self.n_rows):
+            for j in range(0, self.n_cols):
+                self.legal_action_masks[i, j, self.legal_actions[i][j]] = True
+
+        offsets = np.zeros((n_actions, 2), dtype=np.int64)
+        offsets[[ActionType.NORTH, ActionType.EAST, ActionType.SOUTH, ActionType.WEST]] = \
+            [[-1, 0], [0, 1], [1, 0], [0, -1]]
+        cells = np.stack(np.indices((self.n_rows, self.n_cols)), axis=-1)
+        self.next_cells = np.where(self.legal_action_masks[:, :, :, None], cells[:, :, None, :] + offsets,
+                                   cells[:, :, None, :])
+
+        self.rock_distances = np.sqrt(np.sum(np.square(cells[:, :, None, :] - self.rock_coordinates), axis=-1))
+        self.check_accuracy = self.get_sensor_correctness_probability(self.rock_distances)
+        self.goal_distances = self.path_lengths(self.cell_types == RSCellType.GOAL)
+        rock_path_lengths = np.zeros((self.n_rows, self.n_cols, self.n_rocks))
+        for rock_no, (i, j) in enumerate(self.rock_coordinates):
+            rock_cell = np.zeros((self.n_rows, self.n_cols), dtype=bool)
+            rock_cell[i, j] = True
+            rock_path_lengths[:, :, rock_no] = self.path_lengths(rock_cell)
+
+        # Unreachable rocks and exits are discounted to 0
+        self.sample_discounts = self.discount ** rock_path_lengths
+        self.exit_discounts = self.discount ** np.maximum(self.goal_distances - 1, 0)
+
+    def path_lengths(self, targets):
+        """
+        Breadth-first search of the number of moves on the shortest path from every cell to the nearest of
+        the target cells, going around the obstacles
+        :param targets: boolean (n_rows, n_cols) mask of the target cells
+        :return: (n_rows, n_cols) array, inf for the cells that cannot reach a target
+        """
+        lengths = np.where(targets, 0., np.inf)
+        # The cells reached by the moves. Illegal moves stay in place, which never shortens a path
+        moves = self.next_cells[:, :, :ActionType.SAMPLE]
+        frontier = targets
+        length = 0
+        while frontier.any():
+            length += 1
+            reaches_frontier = frontier[moves[..., 0], moves[..., 1]].any(axis=-1)
+            frontier = reaches_frontier & np.isinf(lengths)
+            lengths[frontier] = length
+        return lengths
+
     ''' ===================================================================  '''
     '''                             Utility functions                        '''
     ''' ===================================================================  '''
@@ -196,7 +272,7 @@ class RockModel(Model):
         return DiscreteObservationPool(solver)
 
     def is_terminal(self, rock_state):
-        return self.get_cell_type(rock_state.position) is RSCellType.GOAL
+        return self.env_map[rock_state.i][rock_state.j] == RSCellType.GOAL
 
     def is_valid(self, state):
         if isinstance(state, RockState):
@@ -207,18 +283,23 @@ class RockModel(Model):
             return False
 
     def is_valid_state(self, rock_state):
-        pos = rock_state.position
-        return 0 <= pos.i < self.n_rows and 0 <= pos.j < self.n_cols and \
-               self.get_cell_type(pos) is not RSCellType.OBSTACLE
+        return self.is_valid_pos(rock_state)
 
     def is_valid_pos(self, pos):
         return 0 <= pos.i < self.n_rows and 0 <= pos.j < self.n_cols and \
                self.get_cell_type(pos) is not RSCellType.OBSTACLE
 
     def get_legal_actions(self, state):
+        """
+        :param state: RockState, or GridPosition
+        :return: list of legal action bin numbers
+        """
+        return list(self.legal_actions[state.i][state.j])
+
+    def make_legal_actions(self, pos):
         legal_actions = []
         all_actions = range(0, 5 + self.n_rocks)
-        new_pos = state.position.copy()
+        new_pos = pos.copy()
         i = new_pos.i
         j = new_pos.j
 
@@ -301,7 +382,10 @@ class RockModel(Model):
 
     def create_root_historical_data(self, solver):
         self.create_new_rock_data()
-        return PositionAndRockData(self, self.start_position.copy(), self.all_rock_data, solver)
+        if not self.transpositions:
+            return PositionAndRockData(self, self.start_position.copy(), self.all_rock_data, solver)
+        return PositionAndRockData(self, self.start_position.copy(), self.all_rock_data, solver, self.create_belief(),
+                                   (None,) * self.n_rocks)
 
     def create_new_rock_data(self):
         self.all_rock_data = []
@@ -321,51 +405,40 @@ class RockModel(Model):
         return pos
 
     def make_next_position(self, pos, action_type):
-        is_legal = True
-
-        if action_type >= ActionType.CHECK:
-            pass
+        """
+        :param pos: GridPosition of a cell of the map
+        :param action_type:
+        :return: the GridPosition reached by the action (pos itself if the action does not move), and whether
+        or not the action is legal
+        """
+        is_legal = bool(self.legal_action_masks[pos.i, pos.j, action_type])
 
-        elif action_type is ActionType.SAMPLE:
-            # if you took an illegal action and are in an invalid position
-            # sampling is not a legal action to take
-            if not self.is_valid_pos(pos):
-                is_legal = False
-            else:
-                rock_no = self.get_cell_type(pos)
-                if 0 > rock_no or rock_no >= self.n_rocks:
-                    is_legal = False
-        else:
-            old_position = pos.copy()
-            pos = self.make_adjacent_position(pos, action_type)
-            if not self.is_valid_pos(pos):
-                pos = old_position
-                is_legal = False
+        if is_legal and action_type < ActionType.SAMPLE:
+            next_i, next_j = self.next_cells[pos.i, pos.j, action_type]
+            pos = GridPosition(int(next_i), int(next_j))
         return pos, is_legal
 
     def make_next_state(self, state, action):
         action_type = action.bin_number
-        next_position, is_legal = self.make_next_position(state.position.copy(), action_type)
+        next_position, is_legal = self.make_next_position(state.position, action_type)
 
         if not is_legal:
             # returns a copy of the current state
             return state.copy(), False
 
-        next_state_rock_states = list(state.rock_states)
+        next_state = state.moved_to(next_position)
 
         # update the any_good_rocks flag
-        self.any_good_rocks = False
-        for rock in next_state_rock_states:
-            if rock:
-                self.any_good_rocks = True
+        self.any_good_rocks = state.rocks != 0
 
         if action_type is ActionType.SAMPLE:
-            self.num_times_sampled += 1.0
+            with lock_for(self):
+                self.num_times_sampled += 1.0
 
             rock_no = self.get_cell_type(next_position)
-            next_state_rock_states[rock_no] = False
+            next_state.set_rock(rock_no, False)
 
-        return RockState(next_position, next_state_rock_states), True
+        return next_state, True
 
     def make_observation(self, action, next_state):
         # generate new observation if not checking or sampling a rock
@@ -385,25 +458,18 @@ class RockModel(Model):
 
         observation = self.actual_rock_states[action.rock_no]
 
-        # if checking a rock...
-        dist = next_state.position.euclidean_distance(self.rock_positions[action.rock_no])
-
         # NOISY OBSERVATION
         # bernoulli distribution is a binomial distribution with n = 1
         # if half efficiency distance is 20, and distance to rock is 20, correct has a 50/50
         # chance of being True. If distance is 0, correct has a 100% chance of being True.
-        correct = np.random.binomial(1.0, self.get_sensor_correctness_probability(dist))
+        correct = np.random.binomial(1.0, self.check_accuracy[next_state.i, next_state.j, action.rock_no])
 
         if not correct:
             # Return the incorrect state if the sensors malfunctioned
             observation = not observation
 
-        # If I now believe that a rock, previously bad, is now good, change that here
-        if observation and not next_state.rock_states[action.rock_no]:
-            next_state.rock_states[action.rock_no] = True
-        # Likewise, if I now believe a rock, previously good, is now bad, change that here
-        elif not observation and next_state.rock_states[action.rock_no]:
-            next_state.rock_states[action.rock_no] = False
+        # If I now believe that a rock, previously bad, is now good (or the reverse), change that here
+        next_state.set_rock(action.rock_no, observation)
 
         # Normalize the observation
         if observation > 1:
@@ -411,8 +477,40 @@ class RockModel(Model):
 
         return RockObservation(observation, False)
 
+    def create_belief(self):
+        """
+        The robot starts at the start position, and each rock is good with probability 0.5
+        """
+        return RockBelief(self.start_position.copy(), np.full(self.n_rocks, 0.5))
+
     def belief_update(self, old_belief, action, observation):
-        pass
+        """
+        Exact Bayesian update of a RockBelief
+        :param old_belief: RockBelief
+        :param action: RockAction
+        :param observation: RockObservation
+        :return: RockBelief
+        """
+        if type(action) is int:
+            action = RockAction(action)
+        belief = old_belief.copy()
+        belief.position, is_legal = self.make_next_position(old_belief.position, action.bin_number)
+
+        if action.bin_number == ActionType.SAMPLE and is_legal:
+            # Sampled rocks are bad from then on
+            belief.p_good[self.get_cell_type(old_belief.position)] = 0.0
+
+        elif action.bin_number >= ActionType.CHECK and action.rock_no not in self.unique_rocks_sampled:
+            accuracy = self.check_accuracy[belief.position.i, belief.position.j, action.rock_no]
+            p_good = belief.p_good[action.rock_no]
+            if observation.is_good:
+                likelihood_good, likelihood_bad = p_good * accuracy, (1 - p_good) * (1 - accuracy)
+            else:
+                likelihood_good, likelihood_bad = p_good * (1 - accuracy), (1 - p_good) * accuracy
+            if likelihood_good + likelihood_bad > 0:
+                belief.p_good[action.rock_no] = likelihood_good / (likelihood_good + likelihood_bad)
+
+        return belief
 
     def make_reward(self, state, action, next_state, is_legal):
         if not is_legal:
@@ -426,18 +524,19 @@ class RockModel(Model):
             rock_no = self.get_cell_type(pos)
             if 0 <= rock_no < self.n_rocks:
                 # If the rock ACTUALLY is good, AND I currently believe it to be good, I get rewarded
-                if self.actual_rock_states[rock_no] and state.rock_states[rock_no]:
+                if self.actual_rock_states[rock_no] and state.is_good(rock_no):
                     # IMPORTANT - After sampling, the rock is marked as
                     # bad to show that it is has been dealt with
                     # "next states".rock_states[rock_no] is set to False in make_next_state
-                    state.rock_states[rock_no] = False
-                    self.good_samples += 1.0
+                    with lock_for(self):
+                        self.good_samples += 1.0
                     return self.good_rock_reward
                 # otherwise, I either sampled a bad rock I thought was good, sampled a good rock I thought was bad,
                 # or sampled a bad rock I thought was bad. All bad behavior!!!
                 else:
                     # self.logger.info("Bad rock penalty - %s", str(-self.bad_rock_penalty))
-                    self.num_bad_rocks_sampled += 1.0
+                    with lock_for(self):
+                        self.num_bad_rocks_sampled += 1.0
                     return -self.bad_rock_penalty
             else:
                 # self.logger.warning("Invalid sample action on non-existent rock while making reward!")
@@ -464,16 +563,160 @@ class RockModel(Model):
 
         return result, is_legal
 
+    ''' ===================================================================  '''
+    '''                          Batched generative model                    '''
+    ''' ===================================================================  '''
+
+    def create_particle_set(self):
+        """
+        Rock states are hashable by value, so belief nodes store each distinct state particle once
+        """
+        return ParticleSet()
+
+    def encode_states(self, states):
+        """
+        Rock states are batched as rows of an int array: [i, j, rock bitmask]
+        :param states: sequence of RockStates
+        :return: np.array of shape (len(states), 3)
+        """
+        batch = np.empty((states.__len__(), 3), dtype=np.int64)
+        for k, state in enumerate(states):
+            batch[k] = state.i, state.j, state.rocks
+        return batch
+
+    def decode_states(self, batch):
+        return [RockState.from_value(RockState.pack(i, j, rocks), self.n_rocks) for i, j, rocks in batch]
+
+    def encode_observation(self, observation):
+        if observation.is_empty:
+            return ObservationCode.EMPTY
+        return ObservationCode.GOOD if observation.is_good else ObservationCode.BAD
+
+    def get_observation_code_count(self):
+        return ObservationCode.COUNT
+
+    def legal_action_mask_batch(self, states):
+        states = np.asarray(states, dtype=np.int64)
+        return self.legal_action_masks[states[:, 0], states[:, 1]]
+
+    def generate_step_batch(self, states, actions):
+        """
+        Vectorized generate_step
+        :param states: np.array of shape (K, 3), see encode_states
+        :param actions: np.array of K action bin numbers, or a single action bin number
+        :return: StepResultBatch with next states in the same representation and ObservationCodes
+        """
+        states = np.asarray(states, dtype=np.int64)
+        n_states = states.shape[0]
+        actions = np.asarray(actions, dtype=np.int64)
+        if actions.ndim == 0:
+            actions = np.full(n_states, actions, dtype=np.int64)
+        i, j, rocks = states[:, 0], states[:, 1], states[:, 2]
+
+        # Illegal actions leave the robot in place
+        is_legal = self.legal_action_masks[i, j, actions]
+        illegal = ~is_legal
+        next_states = states.copy()
+        next_states[:, :2] = self.next_cells[i, j, actions]
+        next_i, next_j, next_rocks = next_states[:, 0], next_states[:, 1], next_states[:, 2]
+
+        actual_rocks = np.array([bool(rock) for rock in self.actual_rock_states], dtype=bool)
+        rewards = np.zeros(n_states)
+        observations = np.where(actions < ActionType.SAMPLE, ObservationCode.EMPTY, ObservationCode.BAD)
+
+        # Sampling marks the rock as bad
+        sampled = np.flatnonzero((actions == ActionType.SAMPLE) & is_legal)
+        if sampled.size > 0:
+            sampled_rock = self.cell_types[i[sampled], j[sampled]]
+            next_rocks[sampled] &= ~(1 << sampled_rock)
+            good_sample = actual_rocks[sampled_rock] & ((rocks[sampled] >> sampled_rock) & 1).astype(bool)
+            rewards[sampled] = np.where(good_sample, self.good_rock_reward, -self.bad_rock_penalty)
+
+            n_good = np.count_nonzero(good_sample)
+            with lock_for(self):
+                self.num_times_sampled += sampled.size
+                self.good_samples += n_good
+                self.num_bad_rocks_sampled += sampled.size - n_good
+
+        # Noisy check of the actual rock, unless it was already sampled. The believed state
+        # of the rock is set to the observation
+        checked = np.flatnonzero(actions >= ActionType.CHECK)
+        if checked.size > 0:
+            rock_no = actions[checked] - ActionType.CHECK
+            already_sampled = np.zeros(self.n_rocks, dtype=bool)
+            already_sampled[self.unique_rocks_sampled] = True
+            not_sampled = ~already_sampled[rock_no]
+            checked, rock_no = checked[not_sampled], rock_no[not_sampled]
+
+            correct = np.random.random(rock_no.size) < self.check_accuracy[i[checked], j[checked], rock_no]
+            observed_good = actual_rocks[rock_no] == correct
+            observations[checked] = np.where(observed_good, ObservationCode.GOOD, ObservationCode.BAD)
+            next_rocks[checked] = np.where(observed_good, next_rocks[checked] | (1 << rock_no),
+                                           next_rocks[checked] & ~(1 << rock_no))
+
+        is_terminal = self.cell_types[next_i, next_j] == RSCellType.GOAL
+        rewards[is_terminal] = self.exit_reward
+        rewards[illegal] = -self.illegal_move_penalty
+
+        result = StepResultBatch()
+        result.actions = actions
+        result.next_states = next_states
+        result.observations = observations
+        result.rewards = rewards
+        result.is_terminal = is_terminal
+        result.is_legal = is_legal
+        return result
+
+    def observation_likelihood(self, state, action, next_state, observation):
+        """
+        Moves and samples always observe a bad rock, as do checks of rocks that were already sampled.
+        Other checks observe the state of the rock in the particle, correctly with the check accuracy of
+        the cell. The rock bit is read from state, since checking a rock overwrites it in next_state with
+        the observation (see make_observation and condition_next_state)
+        """
+        if action.bin_number < ActionType.CHECK or action.rock_no in self.unique_rocks_sampled:
+            return 0. if observation.is_good else 1.
+
+        accuracy = self.check_accuracy[next_state.i, next_state.j, action.rock_no]
+        if bool(observation.is_good) == state.is_good(action.rock_no):
+            return accuracy
+        return 1. - accuracy
+
+    def condition_next_state(self, next_state, action, observation):
+        """
+        Checking a rock sets its state to the observation, see make_observation
+        """
+        if action.bin_number >= ActionType.CHECK and action.rock_no not in self.unique_rocks_sampled:
+            next_state.set_rock(action.rock_no, observation.is_good)
+        return next_state
+
+    def value_lower_bound(self, state):
+        """
+        Return of moving along the shortest path to the nearest goal square, or 0 if no goal square can
+        be reached
+        """
+        return self.exit_reward * self.exit_discounts[state.i, state.j]
+
+    def value_upper_bound(self, state):
+        """
+        Every rock that was not sampled yet sampled as soon as it could be reached along the shortest
+        path to it, and the exit reached as soon as possible as well. The rock bits of state are not used, since checking a rock can turn
+        its bit on before it is sampled
+        """
+        unsampled = np.ones(self.n_rocks, dtype=bool)
+        unsampled[self.unique_rocks_sampled] = False
+        return self.good_rock_reward * self.sample_discounts[state.i, state.j][unsampled].sum() + \
+            self.exit_reward * self.exit_discounts[state.i, state.j]
+
     def generate_particles_uninformed(self, previous_belief, action, obs, n_particles):
         old_pos = previous_belief.get_states()[0].position
 
-        particles = []
-        while particles.__len__() < n_particles:
-            old_state = RockState(old_pos, self.sample_rocks())
-            result, is_legal = self.generate_step(old_state, action)
-            if obs == result.observation:
-                particles.append(result.next_state)
-        return particles
+        if self.particle_filter:
+            return self.filter_particles([RockState(old_pos, self.sample_rocks()) for _ in range(n_particles)],
+                                         action, obs, n_particles)
+
+        return self.rejection_sample(lambda: RockState(old_pos, self.sample_rocks()), action,
+                                     lambda observation: obs == observation, n_particles)
 
     @staticmethod
     def disp_cell(rs_cell_type):
@@ -1,8 +1,19 @@
 from __future__ import print_function
 from builtins import str
+from builtins import object
 from pomdpy.discrete_pomdp import DiscreteObservation
 
 
+class ObservationCode(object):
+    """
+    Integer codes of the Rock sample observations, used by the batched generative model
+    """
+    EMPTY = 0
+    BAD = 1
+    GOOD = 2
+    COUNT = 3
+
+
 class RockObservation(DiscreteObservation):
     """
     Default behavior is for the rock observation to say that the rock is empty
@@ -38,9 +38,14 @@ class PositionAndRockData(HistoricalData):
     """
     A class to store the robot position associated with a given belief node, as well as
     explicitly calculated probabilities of goodness for each rock.
+
+    With transpositions enabled it also carries the exact RockBelief of the node and the last observation
+    of each rock, which the generative model writes into the rocks of the simulated states. Together with
+    the position they only depend on the action/observation history, and identify the node in the
+    transposition table.
     """
 
-    def __init__(self, model, grid_position, all_rock_data, solver):
+    def __init__(self, model, grid_position, all_rock_data, solver, belief=None, last_observations=None):
         self.model = model
         self.solver = solver
         self.grid_position = grid_position
@@ -48,6 +53,11 @@ class PositionAndRockData(HistoricalData):
         # List of RockData indexed by the rock number
         self.all_rock_data = all_rock_data
 
+        # Exact belief of the node and tuple of the last observation of each rock (None if it has not been
+        # observed), if transpositions are enabled
+        self.belief = belief
+        self.last_observations = last_observations
+
         # Holds reference to the function for generating legal actions
         if self.model.preferred_actions:
             self.legal_actions = self.generate_smart_actions
@@ -74,18 +84,27 @@ class PositionAndRockData(HistoricalData):
         """
         Passes along a reference to the rock data to the new copy of RockPositionHistory
         """
-        return PositionAndRockData(self.model, self.grid_position.copy(), self.all_rock_data, self.solver)
+        return PositionAndRockData(self.model, self.grid_position.copy(), self.all_rock_data, self.solver,
+                                   self.belief, self.last_observations)
 
     def shallow_copy(self):
         """
         Creates a copy of this object's rock data to pass along to the new copy
         """
         new_rock_data = self.copy_rock_data(self.all_rock_data)
-        return PositionAndRockData(self.model, self.grid_position.copy(), new_rock_data, self.solver)
+        return PositionAndRockData(self.model, self.grid_position.copy(), new_rock_data, self.solver,
+                                   self.belief, self.last_observations)
 
     def update(self, other_belief):
         self.all_rock_data = other_belief.data.all_rock_data
 
+    def transposition_key(self):
+        if self.belief is None:
+            return None
+        # Rounding merges beliefs reached by the same checks in a different order
+        return (self.grid_position.i, self.grid_position.j, tuple(np.round(self.belief.p_good, 9).tolist()),
+                self.last_observations)
+
     def any_good_rocks(self):
         any_good_rocks = False
         for rock_data in self.all_rock_data:
@@ -97,6 +116,9 @@ class PositionAndRockData(HistoricalData):
         next_data = self.deep_copy()
         next_position, is_legal = self.model.make_next_position(self.grid_position.copy(), rock_action.bin_number)
         next_data.grid_position = next_position
+        if self.belief is not None:
+            next_data.belief = self.model.belief_update(self.belief, rock_action, rock_observation)
+            next_data.last_observations = self.next_last_observations(rock_action, rock_observation, is_legal)
 
         if rock_action.bin_number is ActionType.SAMPLE:
             rock_no = self.model.get_cell_type(self.grid_position)
@@ -106,10 +128,8 @@ class PositionAndRockData(HistoricalData):
 
         elif rock_action.bin_number >= ActionType.CHECK:
             rock_no = rock_action.rock_no
-            rock_pos = self.model.rock_positions[rock_no]
 
-            dist = self.grid_position.euclidean_distance(rock_pos)
-            probability_correct = self.model.get_sensor_correctness_probability(dist)
+            probability_correct = self.model.check_accuracy[self.grid_position.i, self.grid_position.j, rock_no]
             probability_incorrect = 1 - probability_correct
 
             rock_data = next_data.all_rock_data[rock_no]
@@ -136,36 +156,22 @@ class PositionAndRockData(HistoricalData):
 
         return next_data
 
+    def next_last_observations(self, rock_action, rock_observation, is_legal):
+        """
+        Mirrors the changes RockModel.make_next_state and RockModel.make_observation make to the rocks of a state
+        """
+        last_observations = self.last_observations
+        if rock_action.bin_number == ActionType.SAMPLE and is_legal:
+            rock_no = self.model.get_cell_type(self.grid_position)
+            last_observations = last_observations[:rock_no] + (False,) + last_observations[rock_no + 1:]
+        elif rock_action.bin_number >= ActionType.CHECK and rock_action.rock_no not in self.model.unique_rocks_sampled:
+            rock_no = rock_action.rock_no
+            last_observations = last_observations[:rock_no] + (bool(rock_observation.is_good),) + \
+                last_observations[rock_no + 1:]
+        return last_observations
+
     def generate_legal_actions(self):
-        legal_actions = []
-        all_actions = range(0, 5 + self.model.n_rocks)
-        new_pos = self.grid_position.copy()
-        i = new_pos.i
-        j = new_pos.j
-
-        for action in all_actions:
-            if action is ActionType.NORTH:
-                new_pos.i -= 1
-            elif action is ActionType.EAST:
-                new_pos.j += 1
-            elif action is ActionType.SOUTH:
-                new_pos.i += 1
-            elif action is ActionType.WEST:
-                new_pos.j -= 1
-
-            if not self.model.is_valid_pos(new_pos):
-                new_pos.i = i
-                new_pos.j = j
-                continue
-            else:
-                if action is ActionType.SAMPLE:
-                    rock_no = self.model.get_cell_type(new_pos)
-                    if 0 > rock_no or rock_no >= self.model.n_rocks:
-                        continue
-                new_pos.i = i
-                new_pos.j = j
-                legal_actions.append(action)
-        return legal_actions
+        return self.model.get_legal_actions(self.grid_position)
 
     def generate_smart_actions(self):
 
@@ -1,6 +1,7 @@
 from __future__ import print_function
 from builtins import range
 from pomdpy.discrete_pomdp import DiscreteState
+from .grid_position import GridPosition
 
 
 class RockState(DiscreteState):
@@ -8,40 +9,106 @@ class RockState(DiscreteState):
     The state contains the position of the robot, as well as a boolean value for each rock
     representing whether it is good (true => good, false => bad).
 
+    The row, the column and the rock bitmask (bit k set => rock k is good) are packed into a single
+    integer, so that states are small and hash and compare in constant time.
+
     This class also implements DiscretizedState in order to allow the state to be easily
     converted to a List
     """
+    __slots__ = ('value', 'n_rocks')
+
+    # Number of bits of the packed value used by each of the row and the column
+    COORDINATE_BITS = 16
+    COORDINATE_MASK = (1 << COORDINATE_BITS) - 1
 
     def __init__(self, grid_position, rock_states):
+        rocks = 0
         if rock_states is not None:
-            assert rock_states.__len__() is not 0
-        self.position = grid_position
-        self.rock_states = rock_states  # list
+            assert rock_states.__len__() != 0
+            for k in range(0, rock_states.__len__()):
+                if rock_states[k]:
+                    rocks |= 1 << k
+        self.n_rocks = 0 if rock_states is None else rock_states.__len__()
+        self.value = RockState.pack(grid_position.i, grid_position.j, rocks)
+
+    @staticmethod
+    def pack(i, j, rocks):
+        return int(i) | (int(j) << RockState.COORDINATE_BITS) | (int(rocks) << (2 * RockState.COORDINATE_BITS))
+
+    @classmethod
+    def from_value(cls, value, n_rocks):
+        """
+        Create a RockState directly from its packed value
+        :param value:
+        :param n_rocks:
+        :return:
+        """
+        state = cls.__new__(cls)
+        state.value = value
+        state.n_rocks = n_rocks
+        return state
+
+    @property
+    def i(self):
+        return self.value & RockState.COORDINATE_MASK
+
+    @property
+    def j(self):
+        return (self.value >> RockState.COORDINATE_BITS) & RockState.COORDINATE_MASK
+
+    @property
+    def rocks(self):
+        """
+        The rock bitmask
+        """
+        return self.value >> (2 * RockState.COORDINATE_BITS)
+
+    @property
+    def position(self):
+        return GridPosition(self.i, self.j)
+
+    @property
+    def rock_states(self):
+        """
+        A new list of the boolean rock values. Use set_rock to change the state of a rock
+        """
+        rocks = self.rocks
+        return [bool(rocks & (1 << k)) for k in range(0, self.n_rocks)]
+
+    def is_good(self, rock_no):
+        return bool(self.value & (1 << (rock_no + 2 * RockState.COORDINATE_BITS)))
+
+    def set_rock(self, rock_no, is_good):
+        bit = 1 << (rock_no + 2 * RockState.COORDINATE_BITS)
+        if is_good:
+            self.value |= bit
+        else:
+            self.value &= ~bit
+
+    def moved_to(self, grid_position):
+        """
+        Returns a copy of this state with the robot at grid_position
+        """
+        return RockState.from_value(RockState.pack(grid_position.i, grid_position.j, self.rocks), self.n_rocks)
 
     def distance_to(self, other_rock_state):
         """
         Distance is measured between beliefs by the sum of the num of different rocks
         """
         assert isinstance(other_rock_state, RockState)
-        distance = 0
-        # distance = self.position.manhattan_distance(other_rock_state.position)
-        for i, j in zip(self.rock_states, other_rock_state.rock_states):
-            if i != j:
-                distance += 1
-        return distance
+        return bin(self.rocks ^ other_rock_state.rocks).count('1')
 
     def __eq__(self, other_rock_state):
-        return self.position == other_rock_state.position and self.rock_states is other_rock_state.rock_states
+        return isinstance(other_rock_state, RockState) and self.value == other_rock_state.value
+
+    def __ne__(self, other_rock_state):
+        return not self.__eq__(other_rock_state)
 
     def copy(self):
-        return RockState(self.position, self.rock_states)
+        return RockState.from_value(self.value, self.n_rocks)
 
     def __hash__(self):
-        """
-        Returns a decimal value representing the binary state string
-        :return:
-        """
-        return int(self.to_string(), 2)
+        return hash(self.value)
 
     def to_string(self):
         state_string = self.position.to_string()
@@ -62,13 +129,7 @@ class RockState(DiscreteState):
         self.position.print_position()
 
         print('Good: {', end=' ')
-        good_rocks = []
-        bad_rocks = []
-        for i in range(0, self.rock_states.__len__()):
-            if self.rock_states[i]:
-                good_rocks.append(i)
-            else:
-                bad_rocks.append(i)
+        good_rocks, bad_rocks = self.separate_rocks()
         for j in good_rocks:
             print(j, end=' ')
         print('}; Bad: {', end=' ')
@@ -82,13 +143,7 @@ class RockState(DiscreteState):
         representing the boolean rock states (good, bad)
         :return:
         """
-        state_list = [self.position.i, self.position.j]
-        for i in range(0, self.rock_states.__len__()):
-            if self.rock_states[i]:
-                state_list.append(True)
-            else:
-                state_list.append(False)
-        return state_list
+        return [self.i, self.j] + self.rock_states
 
     def separate_rocks(self):
         """
@@ -97,9 +152,9 @@ class RockState(DiscreteState):
         """
         good_rocks = []
         bad_rocks = []
-        for i in range(0, self.rock_states.__len__()):
-            if self.rock_states[i]:
+        for i in range(0, self.n_rocks):
+            if self.is_good(i):
                 good_rocks.append(i)
             else:
                 bad_rocks.append(i)
-        return good_rocks, bad_rocks
\ No newline at end of file
+        return good_rocks, bad_rocks
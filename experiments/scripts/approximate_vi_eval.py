@@ -4,6 +4,7 @@ from .plot_alpha_vectors import plot_alpha_vectors
 import os
 import time
 from pomdpy.agent import Results
+from pomdpy.solvers import AlphaVectorSet
 import numpy as np
 
 my_dir = os.path.dirname(__file__)
@@ -32,6 +33,10 @@ def eval_baseline(n_epochs, agent, horizon):
     else:
         raise ValueError('Unsupported baseline planning horizon')
 
+    if baseline is not None:
+        # Older pickles hold a set of AlphaVector
+        baseline = AlphaVectorSet.from_alpha_vectors(baseline)
+
     solver = agent.solver_factory(agent)
     model = agent.model
 
@@ -3,6 +3,7 @@ import matplotlib.colors as colors
 import matplotlib.cm as cmx
 import matplotlib.patches as mpatches
 import numpy as np
+from pomdpy.solvers.alpha_vector import AlphaVectorSet
 
 
 def plot_alpha_vectors(title, gamma, n_actions):
@@ -17,18 +18,16 @@ def plot_alpha_vectors(title, gamma, n_actions):
     # y = np.linspace(0., 1., num=pts)
     # Z = np.zeros(shape=(pts, pts))
     # X, Y = np.meshgrid(x, y)
-    y = np.zeros(shape=pts)
     cmap = get_cmap(n_actions * 10)
     patches, patches_handles = [], []
     for i in range(n_actions):
         patches.append(cmap(i * 10))
         patches_handles.append(mpatches.Patch(color=patches[i], label='action {}'.format(i)))
 
-    for av in gamma:
-        for i in range(pts):
-            # for j in range(pts):
-            y[i] = np.dot(av.v, np.array([x[i], 1. - x[i]]))
-        plt.plot(x, y, color=patches[av.action], linewidth=2)
+    gamma = AlphaVectorSet.from_alpha_vectors(gamma)
+    y = gamma.values(np.stack([x, 1. - x], axis=1))
+    for k, action in enumerate(gamma.actions):
+        plt.plot(x, y[:, k], color=patches[action], linewidth=2)
 
     plt.xlabel('p1')
     plt.legend(handles=patches_handles)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 from __future__ import print_function
 from pomdpy import Agent
-from pomdpy.solvers import POMCP
+from pomdpy.solvers import POMCP, DESPOT
 from pomdpy.log import init_logger
 from examples.rock_sample import RockModel
 import argparse
@@ -12,7 +12,7 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Set the run parameters.')
     parser.add_argument('--env', type=str, help='Specify the env to solve {RockSample}')
     parser.add_argument('--solver', default='POMCP', type=str,
-                        help='Specify the solver to use {POMCP}')
+                        help='Specify the solver to use {POMCP, DESPOT}')
     parser.add_argument('--seed', default=1993, type=int, help='Specify the random seed for numpy.random')
     parser.add_argument('--use_tf', dest='use_tf', action='store_true', help='Set if using TensorFlow')
     parser.add_argument('--discount', default=0.95, type=float, help='Specify the discount factor (default=0.95)')
@@ -38,13 +38,66 @@ if __name__ == '__main__':
                         'node can have in MCTS')
     parser.add_argument('--max_particle_count', default=2000, type=int, help='Upper bound on num of particles a belief '
                         'node can have in MCTS')
+    parser.add_argument('--transpositions', dest='transpositions', action='store_true', help='Share a single belief '
+                        'node between all of the action/observation sequences that reach the same belief, as '
+                        'identified by the historical data of the model')
+    parser.add_argument('--observation_widening', default=0., type=float, help='Coefficient k of progressive '
+                        'widening on observations: an action visited N times has at most k * N^alpha observation '
+                        'children. 0 disables it')
+    parser.add_argument('--observation_widening_exponent', default=0.5, type=float, help='Exponent alpha of '
+                        'progressive widening on observations')
+    parser.add_argument('--action_widening', default=0., type=float, help='Coefficient k of progressive widening on '
+                        'actions: a belief node visited N times tries at most k * N^alpha actions. 0 disables it')
+    parser.add_argument('--action_widening_exponent', default=0.5, type=float, help='Exponent alpha of progressive '
+                        'widening on actions')
+    parser.add_argument('--rave_equivalence', default=0., type=float, help='Equivalence parameter k of RAVE: the '
+                        'all-moves-as-first value of an action tried n times is weighted by sqrt(k / (3n + k)) in UCB '
+                        'action selection. 0 disables RAVE')
+    parser.add_argument('--kld_sampling', dest='kld_sampling', action='store_true', help='Size the particle set of '
+                        'each belief node by KLD sampling, between min_particle_count and max_particle_count')
+    parser.add_argument('--kld_epsilon', default=0.05, type=float, help='Max KL divergence between the particles and '
+                        'the belief they approximate under KLD sampling')
+    parser.add_argument('--kld_delta', default=0.01, type=float, help='Probability that the KLD sampling bound '
+                        'kld_epsilon is exceeded')
+    parser.add_argument('--n_scenarios', default=100, type=int, help='For DESPOT, num of scenarios sampled from the '
+                        'belief of the root at each step')
+    parser.add_argument('--despot_xi', default=0.95, type=float, help='For DESPOT, a trial stops at nodes whose '
+                        'weighted gap between the value bounds is below this fraction of the gap of the root')
     parser.add_argument('--max_depth', default=100, type=int, help='Max depth for a DFS of the belief search tree in '
                         'MCTS')
     parser.add_argument('--action_selection_timeout', default=60, type=int, help='Max num of secs for action selection')
+    parser.add_argument('--tree_backend', default='object', type=str, choices=['object', 'array'],
+                        help='Store the belief tree as linked node objects (object), or in NumPy arrays indexed by '
+                             'node id (array)')
+    parser.add_argument('--approximate_belief', dest='approximate_belief', action='store_true', help='Refill the '
+                        'particles of the new root from the particles of the previous root, even for models that '
+                        'track their belief exactly (RockSample), which otherwise refill them from the exact belief')
+    parser.add_argument('--max_refill_attempts', default=100000, type=int, help='Max num of steps to simulate when '
+                        'refilling the particles of the new root by rejection sampling. For RockSample, only used '
+                        'with --approximate_belief')
+    parser.add_argument('--refill_timeout', default=10.0, type=float, help='Max num of secs to spend refilling the '
+                        'particles of the new root by rejection sampling. For RockSample, only used with '
+                        '--approximate_belief')
+    parser.add_argument('--particle_filter', dest='particle_filter', action='store_true', help='Refill the particles '
+                        'of the new root with a weighted particle filter instead of rejection sampling. Implies '
+                        '--approximate_belief')
+    parser.add_argument('--rollout_particles', default=1, type=int, help='Num of state particles of a leaf to '
+                        'roll out together with the batched generative model')
+    parser.add_argument('--n_workers', default=1, type=int, help='Num of processes to split the n_sims MCTS simulations '
+                        'between')
+    parser.add_argument('--parallel', default='root', type=str, choices=['root', 'tree'],
+                        help='With n_workers > 1, either grow one tree per process and merge the root statistics '
+                             '(root), or have n_workers threads share a single tree (tree)')
+    parser.add_argument('--virtual_loss', default=10.0, type=float, help='Loss temporarily added to the actions on '
+                        'the path of an in-flight simulation in tree-parallel MCTS')
 
     parser.set_defaults(preferred_actions=False)
     parser.set_defaults(use_tf=False)
     parser.set_defaults(save=False)
+    parser.set_defaults(particle_filter=False)
+    parser.set_defaults(approximate_belief=False)
+    parser.set_defaults(kld_sampling=False)
+    parser.set_defaults(transpositions=False)
 
     args = vars(parser.parse_args())
 
@@ -52,10 +105,12 @@ if __name__ == '__main__':
 
     np.random.seed(args['seed'])
 
-    if not args['solver'] == 'POMCP':
-        raise ValueError('solver not supported')
-    else:
+    if args['solver'] == 'POMCP':
         solver = POMCP
+    elif args['solver'] == 'DESPOT':
+        solver = DESPOT
+    else:
+        raise ValueError('solver not supported')
 
     if args['env'] == 'RockSample':
         env = RockModel(args)
@@ -1,4 +1,4 @@
 from __future__ import absolute_import
-from .action_selectors import ucb_action, e_greedy
+from .action_selectors import ucb_action, ucb_bin, e_greedy
 
 __all__ = ['action_selectors']
@@ -1,74 +1,88 @@
-import random
 import numpy as np
 
 
-# UCB1 action selection algorithm
-def ucb_action(mcts, current_node, greedy):
-    best_actions = []
-    best_q_value = -np.inf
-    mapping = current_node.action_map
+def _random_best_bin(scores):
+    """
+    Sample uniformly among the bins with the highest score, with a single draw
+    :param scores: array indexed by bin number, illegal bins set to -inf
+    :return: the sampled bin number
+    """
+    best_q_value = scores.max()
+    assert best_q_value > -np.inf
+    best_bins = np.flatnonzero(scores == best_q_value)
+    return int(best_bins[np.random.randint(best_bins.size)])
 
-    N = mapping.total_visit_count
-    log_n = np.log(N + 1)
 
-    actions = list(mapping.entries.values())
-    random.shuffle(actions)
-    for action_entry in actions:
+def _random_best(mapping, scores):
+    """
+    :return: the Discrete Action of a bin with the highest score, see _random_best_bin
+    """
+    return mapping.pool.sample_an_action(_random_best_bin(scores))
 
-        # Skip illegal actions
-        if not action_entry.is_legal:
-            continue
 
-        current_q = action_entry.mean_q_value
+def _ucb_scores(mcts, greedy, total_visit_count, visit_counts, mean_q_values, legal_mask, rave_mean_q_values):
+    """
+    UCB1 scores of the actions of a belief node, from its statistics arrays indexed by bin number
+    :param rave_mean_q_values: callable returning the RAVE mean Q values, which are only computed if used
+    :return: array of scores, -inf for the illegal actions
+    """
+    scores = np.array(mean_q_values, dtype=float)
 
-        # If the UCB coefficient is 0, this is greedy Q selection
-        if not greedy:
-            current_q += mcts.find_fast_ucb(N, action_entry.visit_count, log_n)
+    # If the UCB coefficient is 0, this is greedy Q selection
+    if not greedy:
+        # RAVE: blend in the all-moves-as-first values, which are trusted less as the action's own visits grow
+        if mcts.model.rave_equivalence > 0:
+            beta = np.sqrt(mcts.model.rave_equivalence / (3. * visit_counts + mcts.model.rave_equivalence))
+            scores = (1. - beta) * scores + beta * rave_mean_q_values()
 
-        if current_q >= best_q_value:
-            if current_q > best_q_value:
-                best_actions = []
-            best_q_value = current_q
-            # best actions is a list of Discrete Actions
-            best_actions.append(action_entry.get_action())
+        scores += mcts.find_fast_ucb_vector(total_visit_count, visit_counts)
 
-    assert best_actions.__len__() is not 0
+        # Progressive widening: only try a new action once the node has been visited often enough
+        if mcts.model.action_widening > 0:
+            visited = np.asarray(visit_counts) > 0
+            n_visited = np.count_nonzero(visited & legal_mask)
+            if n_visited >= mcts.widening_limit(mcts.model.action_widening, mcts.model.action_widening_exponent,
+                                                total_visit_count):
+                scores[~visited] = -np.inf
 
-    return random.choice(best_actions)
+    # Skip illegal actions
+    scores[~legal_mask] = -np.inf
+    return scores
 
 
-def e_greedy(current_node, epsilon):
-    best_actions = []
-    best_q_value = -np.inf
+# UCB1 action selection algorithm
+def ucb_action(mcts, current_node, greedy):
     mapping = current_node.action_map
+    scores = _ucb_scores(mcts, greedy, mapping.total_visit_count, mapping.visit_counts, mapping.mean_q_values,
+                         mapping.legal_mask, lambda: mapping.rave_mean_q_values)
+    return _random_best(mapping, scores)
+
+
+def ucb_bin(mcts, tree, node_id, greedy):
+    """
+    ucb_action for a node of an ArrayBeliefTree, reading the statistics arrays of the tree by node id
+    :param mcts:
+    :param tree: ArrayBeliefTree
+    :param node_id:
+    :param greedy:
+    :return: the bin number of the selected action
+    """
+    scores = _ucb_scores(mcts, greedy, tree.node_visit_count[node_id], tree.visit_count[node_id],
+                         tree.mean_q_value[node_id], tree.is_legal[node_id],
+                         lambda: tree.rave_total_q_value[node_id] / np.maximum(tree.rave_visit_count[node_id], 1))
+    return _random_best_bin(scores)
 
-    actions = list(mapping.entries.values())
-    random.shuffle(actions)
+
+def e_greedy(current_node, epsilon):
+    mapping = current_node.action_map
 
     if np.random.uniform(0, 1) < epsilon:
-        for action_entry in actions:
-            if not action_entry.is_legal:
-                continue
-            else:
-                return action_entry.get_action()
-        # No legal actions
-        raise RuntimeError('No legal actions to take')
+        legal_bins = np.flatnonzero(mapping.legal_mask)
+        if legal_bins.size == 0:
+            # No legal actions
+            raise RuntimeError('No legal actions to take')
+        return mapping.pool.sample_an_action(int(legal_bins[np.random.randint(legal_bins.size)]))
     else:
         # Greedy choice
-        for action_entry in actions:
-            # Skip illegal actions
-            if not action_entry.is_legal:
-                continue
-
-            current_q = action_entry.mean_q_value
-
-            if current_q >= best_q_value:
-                if current_q > best_q_value:
-                    best_actions = []
-                best_q_value = current_q
-                # best actions is a list of Discrete Actions
-                best_actions.append(action_entry.get_action())
-
-        assert best_actions.__len__() is not 0
-
-        return random.choice(best_actions)
\ No newline at end of file
+        scores = np.where(mapping.legal_mask, mapping.mean_q_values, -np.inf)
+        return _random_best(mapping, scores)
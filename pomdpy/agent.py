@@ -34,7 +34,7 @@ class Agent:
 
     def discounted_return(self):
 
-        if self.model.solver == 'ValueIteration':
+        if self.model.solver in ('ValueIteration', 'IncrementalPruning'):
             solver = self.solver_factory(self)
 
             self.run_value_iteration(solver, 1)
@@ -56,6 +56,8 @@ class Agent:
         console(2, module, 'ave discounted return/step: ' + str(self.experiment_results.discounted_return.mean) +
                 ' +- ' + str(self.experiment_results.discounted_return.std_err()))
         console(2, module, 'ave time/epoch: ' + str(self.experiment_results.time.mean))
+        if self.model.refill_metrics.attempts.count > 0:
+            console(2, module, 'particle ' + self.model.refill_metrics.to_string())
 
         self.logger.info('env: ' + self.model.env + '\t' +
                          'epochs: ' + str(self.model.n_epochs) + '\t' +
@@ -138,7 +140,7 @@ class Agent:
             # Reset the epoch stats
             self.results = Results()
 
-            if self.model.solver == 'POMCP':
+            if self.model.solver in ('POMCP', 'DESPOT'):
                 eps = self.run_pomcp(i + 1, eps)
                 self.model.reset_for_epoch()
 
@@ -194,6 +196,9 @@ class Agent:
                 console(3, module, 'Terminated after episode step ' + str(i + 1))
                 break
 
+        # Stop the worker processes of the solver
+        solver.close()
+
         self.results.time.add(time.time() - epoch_start)
         self.results.update_reward_results(reward, discounted_reward)
 
@@ -202,6 +207,7 @@ class Agent:
         solver.history.show()
         self.results.show(epoch)
         console(3, module, 'Total possible undiscounted return: ' + str(self.model.get_max_undiscounted_return()))
+        console(3, module, 'Particle ' + self.model.refill_metrics.to_string())
         print_divider('medium')
 
         self.experiment_results.time.add(self.results.time.running_total)
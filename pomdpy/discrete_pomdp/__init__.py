@@ -6,6 +6,8 @@ from .discrete_observation import DiscreteObservation
 from .discrete_observation_mapping import DiscreteObservationMap, DiscreteObservationMapEntry
 from .discrete_observation_pool import DiscreteObservationPool
 from .discrete_state import DiscreteState
+from .observation_index import ObservationIndex
+from .array_belief_tree import ArrayBeliefTree, ArrayBeliefNode
 
 __all__ = ['discrete_action', 'discrete_action_mapping', 'discrete_action_pool', 'discrete_observation',
-           'discrete_observation_mapping', 'discrete_state']
+           'discrete_observation_mapping', 'discrete_state', 'observation_index', 'array_belief_tree']
@@ -0,0 +1,650 @@
+from __future__ import division
+from builtins import range
+from builtins import object
+import random
+import numpy as np
+from pomdpy.pomdp import BeliefStructure, ActionMapping, ObservationMapping, ObservationMappingEntry
+from .discrete_action_mapping import DiscreteActionMappingEntry
+from .observation_index import ObservationIndex
+
+
+class ArrayBeliefTree(BeliefStructure):
+    """
+    An alternative to BeliefTree for discrete action spaces that stores the tree in growable NumPy arrays
+    instead of a web of linked node, mapping and entry objects.
+
+    * Belief nodes are integer ids into the node arrays. Each node owns one row of the (node, action) arrays,
+    * which hold the statistics of every action mapping entry of that node.
+    * Observation edges are integer ids into the edge arrays. The edges leaving a node form a linked list
+    * (node_first_edge -> edge_next -> ...), and edge_index maps (node, action, observation
+    * code) to an edge. The total visit count of the edges of each (node, action) pair is cached in a
+    * (node, action) array.
+
+    Per node, only a small ArrayBeliefNode handle (with its particles and historical data) is kept as a
+    Python object. Its ArrayActionMapping is created on first access, and action mapping entries, action
+    nodes and observation mappings are light-weight views over the arrays, so the tree exposes the same
+    interface to the solvers as BeliefTree. The search itself (see POMCP.traverse_array) works on the
+    arrays by node id, through child_id and backup.
+    """
+    def __init__(self, agent, capacity=1024):
+        super(ArrayBeliefTree, self).__init__()
+        self.agent = agent
+        self.n_actions = len(agent.action_pool.all_actions)
+        self.observation_index = ObservationIndex(agent.model)
+        self.root = None
+        self.allocate(capacity, capacity)
+
+    def allocate(self, node_capacity, edge_capacity):
+        # ------------ Belief nodes ------------- #
+        self.node_capacity = node_capacity
+        self.n_nodes = 0
+        self.free_nodes = []
+        self.nodes = [None] * node_capacity
+        self.node_parent_edge = np.full(node_capacity, -1, dtype=np.int64)
+        self.node_first_edge = np.full(node_capacity, -1, dtype=np.int64)
+        self.node_depth = np.zeros(node_capacity, dtype=np.int32)
+        self.node_visit_count = np.zeros(node_capacity, dtype=np.int64)
+
+        # ------ Action edges, one row per node ------- #
+        self.visit_count = np.zeros((node_capacity, self.n_actions), dtype=np.int64)
+        self.total_q_value = np.zeros((node_capacity, self.n_actions))
+        self.mean_q_value = np.zeros((node_capacity, self.n_actions))
+        self.is_legal = np.zeros((node_capacity, self.n_actions), dtype=bool)
+        self.has_action_node = np.zeros((node_capacity, self.n_actions), dtype=bool)
+        self.rave_visit_count = np.zeros((node_capacity, self.n_actions), dtype=np.int64)
+        self.rave_total_q_value = np.zeros((node_capacity, self.n_actions))
+        self.observation_visit_count = np.zeros((node_capacity, self.n_actions), dtype=np.int64)
+
+        # --------- Observation edges ----------- #
+        self.edge_capacity = edge_capacity
+        self.n_edges = 0
+        self.free_edges = []
+        self.edge_observation = [None] * edge_capacity
+        self.edge_code = np.full(edge_capacity, -1, dtype=np.int64)
+        self.edge_parent = np.full(edge_capacity, -1, dtype=np.int64)
+        self.edge_action = np.full(edge_capacity, -1, dtype=np.int64)
+        self.edge_child = np.full(edge_capacity, -1, dtype=np.int64)
+        self.edge_next = np.full(edge_capacity, -1, dtype=np.int64)
+        self.edge_visit_count = np.zeros(edge_capacity, dtype=np.int64)
+        self.edge_index = {}
+
+    @staticmethod
+    def grow(array, capacity, fill=0):
+        grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+        grown[:array.shape[0]] = array
+        return grown
+
+    def grow_nodes(self):
+        capacity = 2 * self.node_capacity
+        self.nodes += [None] * (capacity - self.node_capacity)
+        self.node_parent_edge = self.grow(self.node_parent_edge, capacity, -1)
+        self.node_first_edge = self.grow(self.node_first_edge, capacity, -1)
+        self.node_depth = self.grow(self.node_depth, capacity)
+        self.node_visit_count = self.grow(self.node_visit_count, capacity)
+        self.visit_count = self.grow(self.visit_count, capacity)
+        self.total_q_value = self.grow(self.total_q_value, capacity)
+        self.mean_q_value = self.grow(self.mean_q_value, capacity)
+        self.is_legal = self.grow(self.is_legal, capacity, False)
+        self.has_action_node = self.grow(self.has_action_node, capacity, False)
+        self.rave_visit_count = self.grow(self.rave_visit_count, capacity)
+        self.rave_total_q_value = self.grow(self.rave_total_q_value, capacity)
+        self.observation_visit_count = self.grow(self.observation_visit_count, capacity)
+        self.node_capacity = capacity
+
+    def grow_edges(self):
+        capacity = 2 * self.edge_capacity
+        self.edge_observation += [None] * (capacity - self.edge_capacity)
+        self.edge_code = self.grow(self.edge_code, capacity, -1)
+        self.edge_parent = self.grow(self.edge_parent, capacity, -1)
+        self.edge_action = self.grow(self.edge_action, capacity, -1)
+        self.edge_child = self.grow(self.edge_child, capacity, -1)
+        self.edge_next = self.grow(self.edge_next, capacity, -1)
+        self.edge_visit_count = self.grow(self.edge_visit_count, capacity)
+        self.edge_capacity = capacity
+
+    # --------- TREE MODIFICATION ------- #
+    def reset(self):
+        """
+        Reset the tree
+        :return:
+        """
+        self.allocate(self.node_capacity, self.edge_capacity)
+        self.root = self.add_node(-1)
+        return self.root
+
+    def reset_root_data(self):
+        """
+        Completely resets the root data
+        :return:
+        """
+        self.root.data = self.agent.model.create_root_historical_data(self.agent)
+
+    def reset_data(self, root_data=None):
+        """
+        Keeps information from the provided root node
+        :return:
+        """
+        if root_data is not None:
+            self.root.data.reset(root_data)
+        else:
+            self.root.data.reset()
+
+    def initialize(self, init_value=None):
+        self.reset_root_data()
+        self.set_legal_actions(self.root.id)
+
+    def set_legal_actions(self, node_id):
+        self.is_legal[node_id] = False
+        self.is_legal[node_id, list(self.agent.action_pool.create_bin_sequence(self.nodes[node_id]))] = True
+
+    def add_node(self, parent_edge):
+        if self.free_nodes:
+            node_id = self.free_nodes.pop()
+        else:
+            if self.n_nodes == self.node_capacity:
+                self.grow_nodes()
+            node_id = self.n_nodes
+            self.n_nodes += 1
+
+        self.node_parent_edge[node_id] = parent_edge
+        self.node_first_edge[node_id] = -1
+        if parent_edge < 0:
+            self.node_depth[node_id] = 0
+        else:
+            self.node_depth[node_id] = self.node_depth[self.edge_parent[parent_edge]] + 1
+        self.node_visit_count[node_id] = 0
+        self.visit_count[node_id] = 0
+        self.total_q_value[node_id] = 0
+        self.mean_q_value[node_id] = 0
+        self.is_legal[node_id] = False
+        self.has_action_node[node_id] = False
+        self.rave_visit_count[node_id] = 0
+        self.rave_total_q_value[node_id] = 0
+        self.observation_visit_count[node_id] = 0
+
+        node = ArrayBeliefNode(self, node_id)
+        self.nodes[node_id] = node
+        return node
+
+    def add_child(self, node_id, bin_number, observation):
+        """
+        Creates a new belief node and the observation edge leading to it from the given node and action
+        :return: belief node
+        """
+        if self.free_edges:
+            edge = self.free_edges.pop()
+        else:
+            if self.n_edges == self.edge_capacity:
+                self.grow_edges()
+            edge = self.n_edges
+            self.n_edges += 1
+
+        self.edge_parent[edge] = node_id
+        self.edge_action[edge] = bin_number
+        self.edge_observation[edge] = observation
+        self.edge_code[edge] = code = self.observation_index.code(observation)
+        self.edge_visit_count[edge] = 0
+        self.edge_next[edge] = self.node_first_edge[node_id]
+        self.node_first_edge[node_id] = edge
+        self.edge_index[(node_id, bin_number, code)] = edge
+        self.has_action_node[node_id, bin_number] = True
+
+        child_node = self.add_node(edge)
+        self.edge_child[edge] = child_node.id
+        return child_node
+
+    def get_child_edge(self, node_id, bin_number, observation):
+        return self.edge_index.get((node_id, bin_number, self.observation_index.code(observation)), -1)
+
+    def child_id(self, node_id, bin_number, observation):
+        """
+        Id of the child of a node for an action and an observation, or -1 if there is none. The historical
+        data of the child is updated, as by BeliefNode.child
+        :param node_id:
+        :param bin_number:
+        :param observation:
+        :return:
+        """
+        edge = self.get_child_edge(node_id, bin_number, observation)
+        if edge < 0:
+            return -1
+        child_node = self.nodes[self.edge_child[edge]]
+        child_node.data.update(self.nodes[node_id])
+        return child_node.id
+
+    def backup(self, node_id, bin_number, q_value):
+        """
+        Visit an action of a node and add a Q value to its statistics, the update rule of
+        DiscreteActionMappingEntry.update_visit_count(1) followed by update_q_value(q_value)
+        :param node_id:
+        :param bin_number:
+        :param q_value:
+        :return:
+        """
+        self.visit_count[node_id, bin_number] += 1
+        self.node_visit_count[node_id] += 1
+        if q_value == 0:
+            return
+        self.total_q_value[node_id, bin_number] += q_value
+        self.mean_q_value[node_id, bin_number] = self.total_q_value[node_id, bin_number] / \
+            self.visit_count[node_id, bin_number]
+
+    def update_rave(self, node_id, bins, q_value):
+        self.rave_visit_count[node_id, bins] += 1
+        self.rave_total_q_value[node_id, bins] += q_value
+
+    def get_child_edges(self, node_id, bin_number=None):
+        edges = []
+        edge = self.node_first_edge[node_id]
+        while edge >= 0:
+            if bin_number is None or self.edge_action[edge] == bin_number:
+                edges.append(edge)
+            edge = self.edge_next[edge]
+        return edges
+
+    def delete_edge(self, edge):
+        """
+        Unlinks an observation edge from its parent and releases the entire subtree below it
+        :param edge:
+        :return:
+        """
+        node_id = self.edge_parent[edge]
+        previous = -1
+        current = self.node_first_edge[node_id]
+        while current != edge:
+            previous = current
+            current = self.edge_next[current]
+        if previous < 0:
+            self.node_first_edge[node_id] = self.edge_next[edge]
+        else:
+            self.edge_next[previous] = self.edge_next[edge]
+        self.observation_visit_count[node_id, self.edge_action[edge]] -= self.edge_visit_count[edge]
+        self.release_edge(edge)
+
+    def release_edge(self, edge):
+        """
+        Frees an observation edge and the entire subtree below it. The edge must already be unlinked
+        from its parent, or its parent must be released too
+        :param edge:
+        :return:
+        """
+        stack = [edge]
+        while stack:
+            edge = stack.pop()
+            del self.edge_index[(int(self.edge_parent[edge]), int(self.edge_action[edge]), int(self.edge_code[edge]))]
+            node_id = self.edge_child[edge]
+            self.edge_observation[edge] = None
+            self.free_edges.append(int(edge))
+
+            stack.extend(self.get_child_edges(node_id))
+
+            # Release the belief node
+            node = self.nodes[node_id]
+            node.data = None
+            node.state_particles = None
+            self.nodes[node_id] = None
+            self.free_nodes.append(int(node_id))
+
+    def prune_siblings(self, bn):
+        """
+        Prune all of the sibling nodes of the provided belief node, leaving the parents
+        and ancestors of bn intact
+        :param bn:
+        :return:
+        """
+        if bn is None:
+            return
+
+        parent_edge = self.node_parent_edge[bn.id]
+        if parent_edge < 0:
+            return
+
+        for edge in self.get_child_edges(self.edge_parent[parent_edge]):
+            if edge != parent_edge:
+                self.delete_edge(edge)
+
+
+class ArrayBeliefNode(object):
+    """
+    Handle to a belief node of an ArrayBeliefTree. Mirrors the interface of BeliefNode.
+
+    The statistics and the links of the node live in the arrays of the tree; the handle only owns
+    the state particles and the historical data of the node
+    """
+    def __init__(self, tree, id):
+        self.tree = tree
+        self.id = id
+        self.data = None
+        self.state_particles = tree.agent.model.create_particle_set()
+        self._action_map = None
+
+    @property
+    def action_map(self):
+        # Most nodes are only searched through the arrays of the tree, and never need a mapping
+        if self._action_map is None:
+            self._action_map = ArrayActionMapping(self.tree, self)
+        return self._action_map
+
+    @action_map.setter
+    def action_map(self, action_map):
+        self._action_map = action_map
+
+    @property
+    def depth(self):
+        return int(self.tree.node_depth[self.id])
+
+    @property
+    def parent_entry(self):
+        edge = self.tree.node_parent_edge[self.id]
+        if edge < 0:
+            return None
+        return ArrayObservationMapEntry(self.tree, edge)
+
+    def copy(self):
+        bn = ArrayBeliefNode(self.tree, self.id)
+        # copy the data
+        bn.data = self.data.copy()
+        # share a reference to the action map
+        bn.action_map = self.action_map
+        bn.state_particles = self.state_particles
+        return bn
+
+    # Randomly select a History Entry
+    def sample_particle(self):
+        return random.choice(self.state_particles)
+
+    # -------------------- Tree-related getters  ---------------------- #
+    def get_parent_action_node(self):
+        edge = self.tree.node_parent_edge[self.id]
+        if edge < 0:
+            return None
+        parent = self.tree.nodes[self.tree.edge_parent[edge]]
+        return parent.action_map.get_entry(int(self.tree.edge_action[edge])).action_node
+
+    def get_parent_belief(self):
+        edge = self.tree.node_parent_edge[self.id]
+        if edge < 0:
+            return None
+        return self.tree.nodes[self.tree.edge_parent[edge]]
+
+    # Returns the last observation received before this belief
+    def get_last_observation(self):
+        edge = self.tree.node_parent_edge[self.id]
+        if edge < 0:
+            return None
+        return self.tree.edge_observation[edge].copy()
+
+    def get_last_action(self):
+        edge = self.tree.node_parent_edge[self.id]
+        if edge < 0:
+            return None
+        return self.action_map.pool.sample_an_action(int(self.tree.edge_action[edge]))
+
+    def get_child(self, action, obs):
+        edge = self.tree.get_child_edge(self.id, action.bin_number, obs)
+        if edge < 0:
+            return None
+        return self.tree.nodes[self.tree.edge_child[edge]]
+
+    def child(self, action, obs):
+        child_id = self.tree.child_id(self.id, action.bin_number, obs)
+        if child_id < 0:
+            return None
+        return self.tree.nodes[child_id]
+
+    # ----------- Core Methods -------------- #
+
+    def create_or_get_child(self, action, obs):
+        """
+        Adds a child for the given action and observation, or returns a pre-existing one if it
+        already existed.
+        :param action:
+        :param obs:
+        :return: belief node, True iff the child node is new
+        """
+        child_node = self.get_child(action, obs)
+        if child_node is None:
+            child_node = self.tree.add_child(self.id, action.bin_number, obs)
+            if self.data is not None:
+                child_node.data = self.data.create_child(action, obs)
+            self.tree.set_legal_actions(child_node.id)
+            return child_node, True
+
+        # Update the re-used child belief node's data
+        child_node.data.update(child_node.get_parent_belief())
+        return child_node, False
+
+
+class ArrayActionMapping(ActionMapping):
+    """
+    The action mapping of a belief node in an ArrayBeliefTree. Its entries are views over one row
+    of the (node, action) arrays of the tree.
+    """
+    def __init__(self, tree, belief_node_owner):
+        super(ArrayActionMapping, self).__init__(belief_node_owner)
+        self.tree = tree
+        self.id = belief_node_owner.id
+        self.pool = tree.agent.action_pool
+        self.number_of_bins = tree.n_actions
+        # The entries are stateless views, so they are created once per mapping
+        self.entry_views = [ArrayActionMappingEntry(self, i) for i in range(self.number_of_bins)]
+        self.entry_dict = dict(enumerate(self.entry_views))
+
+    @property
+    def total_visit_count(self):
+        return int(self.tree.node_visit_count[self.id])
+
+    @total_visit_count.setter
+    def total_visit_count(self, value):
+        self.tree.node_visit_count[self.id] = value
+
+    # Statistics of the entries are the row of this node in the arrays of the tree
+    @property
+    def visit_counts(self):
+        return self.tree.visit_count[self.id]
+
+    @property
+    def total_q_values(self):
+        return self.tree.total_q_value[self.id]
+
+    @property
+    def mean_q_values(self):
+        return self.tree.mean_q_value[self.id]
+
+    @property
+    def legal_mask(self):
+        return self.tree.is_legal[self.id]
+
+    @property
+    def rave_visit_counts(self):
+        return self.tree.rave_visit_count[self.id]
+
+    @property
+    def rave_total_q_values(self):
+        return self.tree.rave_total_q_value[self.id]
+
+    @property
+    def rave_mean_q_values(self):
+        return self.tree.rave_total_q_value[self.id] / np.maximum(self.tree.rave_visit_count[self.id], 1)
+
+    def update_rave(self, bins, q_value):
+        self.tree.update_rave(self.id, bins, q_value)
+
+    @property
+    def number_of_children(self):
+        return int(np.count_nonzero(self.tree.has_action_node[self.id]))
+
+    @property
+    def bin_sequence(self):
+        return [int(i) for i in np.flatnonzero(self.tree.is_legal[self.id])]
+
+    @property
+    def entries(self):
+        return self.entry_dict
+
+    def get_action_node(self, action):
+        return self.entry_views[action.bin_number].child_node
+
+    def create_action_node(self, action):
+        self.tree.has_action_node[self.id, action.bin_number] = True
+        return self.entry_views[action.bin_number].child_node
+
+    def delete_child(self, entry):
+        entry.update_visit_count(-entry.visit_count)
+        entry.total_q_value = 0
+        entry.mean_q_value = 0
+        for edge in self.tree.get_child_edges(self.id, entry.bin_number):
+            self.tree.delete_edge(edge)
+        self.tree.has_action_node[self.id, entry.bin_number] = False
+
+    def get_child_entries(self):
+        return [self.entry_views[i] for i in np.flatnonzero(self.tree.has_action_node[self.id])]
+
+    def get_visited_entries(self):
+        return [self.entry_views[i] for i in np.flatnonzero(self.tree.visit_count[self.id])]
+
+    # Returns a shuffled list of all ActionMappingEntries associated with this mapping
+    def get_all_entries(self):
+        all_actions = list(self.entries.values())
+        np.random.shuffle(all_actions)
+        return all_actions
+
+    def get_entry(self, action_bin_number):
+        return self.entry_views[action_bin_number]
+
+    # No more bins to try -> no action to try
+    # Otherwise we sample a new action using the first bin to be tried
+    def get_next_action_to_try(self):
+        unvisited = np.flatnonzero(self.tree.is_legal[self.id] & (self.tree.visit_count[self.id] == 0))
+        if unvisited.size != 0:
+            return self.pool.sample_an_action(int(np.random.choice(unvisited)))
+        else:
+            return None
+
+    def update_entry_visit_count(self, action, delta_n_visits):
+        return self.get_entry(action).update_visit_count(delta_n_visits)
+
+    def update(self):
+        self.tree.set_legal_actions(self.id)
+
+
+class ArrayActionMappingEntry(DiscreteActionMappingEntry):
+    """
+    A view of one (belief, action) edge of an ArrayBeliefTree. The statistics arrays of the parent
+    mapping are rows of the arrays of the tree, so the update rules of DiscreteActionMappingEntry
+    apply unchanged
+    """
+    preferred_action = False
+
+    def __init__(self, action_mapping, bin_number):
+        self.map = action_mapping
+        self.bin_number = bin_number
+        self.tree = action_mapping.tree
+        self.id = action_mapping.id
+        self.action_node = ArrayActionNode(self)
+
+    @property
+    def child_node(self):
+        if not self.tree.has_action_node[self.id, self.bin_number]:
+            return None
+        return self.action_node
+
+
+class ArrayActionNode(object):
+    """
+    A view of the action node reached by taking an action from a belief node of an ArrayBeliefTree
+    """
+    def __init__(self, parent_entry):
+        self.parent_entry = parent_entry
+        self.observation_map = ArrayObservationMap(self)
+
+    def get_parent_belief(self):
+        return self.parent_entry.map.owner
+
+    # Returns a specific child belief node given the observation
+    def get_child(self, obs):
+        return self.observation_map.get_belief(obs)
+
+    # returns belief node, boolean
+    def create_or_get_child(self, obs):
+        child_node = self.observation_map.get_belief(obs)
+        added = False
+        if child_node is None:
+            child_node = self.observation_map.create_belief(obs)
+            added = True
+        return child_node, added
+
+
+class ArrayObservationMap(ObservationMapping):
+    """
+    A view of the observation edges leaving an action node of an ArrayBeliefTree
+    """
+    def __init__(self, action_node):
+        super(ArrayObservationMap, self).__init__(action_node)
+        self.tree = action_node.parent_entry.tree
+        self.id = action_node.parent_entry.id
+        self.bin_number = action_node.parent_entry.bin_number
+
+    @property
+    def total_visit_count(self):
+        return int(self.tree.observation_visit_count[self.id, self.bin_number])
+
+    @property
+    def child_map(self):
+        return dict((entry.observation, entry) for entry in self.get_child_entries())
+
+    def get_belief(self, disc_observation):
+        edge = self.tree.get_child_edge(self.id, self.bin_number, disc_observation)
+        if edge < 0:
+            return None
+        return self.tree.nodes[self.tree.edge_child[edge]]
+
+    def create_belief(self, disc_observation):
+        return self.tree.add_child(self.id, self.bin_number, disc_observation)
+
+    def delete_child(self, obs_mapping_entry):
+        self.tree.delete_edge(obs_mapping_entry.edge)
+
+    def get_child_entries(self):
+        return [ArrayObservationMapEntry(self.tree, edge) for edge in self.tree.get_child_edges(self.id,
+                                                                                                self.bin_number)]
+
+    def get_entry(self, obs):
+        edge = self.tree.get_child_edge(self.id, self.bin_number, obs)
+        if edge < 0:
+            return None
+        return ArrayObservationMapEntry(self.tree, edge)
+
+
+class ArrayObservationMapEntry(ObservationMappingEntry):
+    """
+    A view of one (belief, action, observation) edge of an ArrayBeliefTree
+    """
+    def __init__(self, tree, edge):
+        self.tree = tree
+        self.edge = edge
+
+    @property
+    def map(self):
+        parent = self.tree.nodes[self.tree.edge_parent[self.edge]]
+        return parent.action_map.get_entry(int(self.tree.edge_action[self.edge])).action_node.observation_map
+
+    @property
+    def observation(self):
+        return self.tree.edge_observation[self.edge]
+
+    @property
+    def child_node(self):
+        return self.tree.nodes[self.tree.edge_child[self.edge]]
+
+    @property
+    def visit_count(self):
+        return int(self.tree.edge_visit_count[self.edge])
+
+    def get_observation(self):
+        return self.observation.copy()
+
+    def update_visit_count(self, delta_n_visits):
+        self.tree.edge_visit_count[self.edge] += delta_n_visits
+        self.tree.observation_visit_count[self.tree.edge_parent[self.edge], self.tree.edge_action[self.edge]] += \
+            delta_n_visits
@@ -12,6 +12,9 @@ class DiscreteActionMapping(ActionMapping):
     taken from that Belief Node.
 
     This is a concrete implementation of the abstract class ActionMapping for Discrete POMDPs
+
+    The statistics of the entries are stored in arrays indexed by bin number, so that action
+    selection can operate on all of the entries of the mapping at once
     """
     def __init__(self, belief_node_owner, discrete_action_pool, bin_sequence):
         super(DiscreteActionMapping, self).__init__(belief_node_owner)
@@ -22,16 +25,20 @@ class DiscreteActionMapping(ActionMapping):
         self.number_of_children = 0
         self.total_visit_count = 0
 
-        for i in range(0,self.number_of_bins):
-            entry = DiscreteActionMappingEntry()
-            entry.bin_number = i
-            entry.map = self
-            entry.is_legal = False
-            self.entries.__setitem__(i, entry)
+        # Statistics of the entries, indexed by bin number
+        self.visit_counts = np.zeros(self.number_of_bins, dtype=np.int64)
+        self.total_q_values = np.zeros(self.number_of_bins)
+        self.mean_q_values = np.zeros(self.number_of_bins)
+        self.legal_mask = np.zeros(self.number_of_bins, dtype=bool)
+        # All-moves-as-first statistics for RAVE
+        self.rave_visit_counts = np.zeros(self.number_of_bins, dtype=np.int64)
+        self.rave_total_q_values = np.zeros(self.number_of_bins)
+
+        for i in range(0, self.number_of_bins):
+            self.entries.__setitem__(i, DiscreteActionMappingEntry(self, i))
 
         # Only entries in the sequence are legal
-        for bin_number in self.bin_sequence:
-            self.entries.get(bin_number).is_legal = True
+        self.legal_mask[list(self.bin_sequence)] = True
 
     def copy(self):
         action_map_copy = DiscreteActionMapping(self.owner, self.pool, list(self.bin_sequence))
@@ -39,8 +46,29 @@ class DiscreteActionMapping(ActionMapping):
         action_map_copy.entries = self.entries.copy()
         action_map_copy.number_of_children = self.number_of_children
         action_map_copy.total_visit_count = self.total_visit_count
+        # The copied entries still refer to this mapping, so share its statistics
+        action_map_copy.visit_counts = self.visit_counts
+        action_map_copy.total_q_values = self.total_q_values
+        action_map_copy.mean_q_values = self.mean_q_values
+        action_map_copy.legal_mask = self.legal_mask
+        action_map_copy.rave_visit_counts = self.rave_visit_counts
+        action_map_copy.rave_total_q_values = self.rave_total_q_values
         return action_map_copy
 
+    @property
+    def rave_mean_q_values(self):
+        return self.rave_total_q_values / np.maximum(self.rave_visit_counts, 1)
+
+    def update_rave(self, bins, q_value):
+        """
+        All-moves-as-first update: count q_value as a return of each of the actions in bins
+        :param bins: mask over bin numbers of the actions taken from this belief onwards
+        :param q_value:
+        :return:
+        """
+        self.rave_visit_counts[bins] += 1
+        self.rave_total_q_values[bins] += q_value
+
     def get_action_node(self, action):
         return self.entries.get(action.bin_number).child_node
 
@@ -101,35 +129,68 @@ class DiscreteActionMapping(ActionMapping):
     def update(self):
         self.bin_sequence = self.pool.create_bin_sequence(self.owner)
 
-        # reset the entries to false
-        for entry in list(self.entries.values()):
-            entry.is_legal = False
-
         # Only entries in the sequence are legal
-        for bin_number in self.bin_sequence:
-            self.entries.get(bin_number).is_legal = True
+        self.legal_mask[:] = False
+        self.legal_mask[list(self.bin_sequence)] = True
 
 
 class DiscreteActionMappingEntry(ActionMappingEntry):
     """
     A concrete class implementing ActionMappingEntry for a discrete action space.
 
-    Each entry stores its bin number and a reference back to its parent map, as well as a child node,
-    visit count, total and mean Q-values, and a flag for whether or not the action is legal.
+    Each entry stores its bin number and a reference back to its parent map, as well as a child node.
+    The visit count, total and mean Q-values, and the flag for whether or not the action is legal
+    are read from and written to the statistics arrays of the parent map.
     """
-    def __init__(self):
-        self.bin_number = -1
-        self.map = None     # DiscreteActionMapping
+    def __init__(self, action_map, bin_number):
+        self.bin_number = bin_number
+        self.map = action_map     # DiscreteActionMapping
         self.child_node = None       # ActionNode
-        self.visit_count = 0
-        self.total_q_value = 0
-        self.mean_q_value = 0
-        self.is_legal = False
 
         # Mark this action mapping entry as preferred. This ensure that the Q value is always positive
         # So that the agent will favor this action, even if shit is hitting the fan
         self.preferred_action = False
 
+    @property
+    def visit_count(self):
+        return self.map.visit_counts[self.bin_number]
+
+    @visit_count.setter
+    def visit_count(self, value):
+        self.map.visit_counts[self.bin_number] = value
+
+    @property
+    def total_q_value(self):
+        return self.map.total_q_values[self.bin_number]
+
+    @total_q_value.setter
+    def total_q_value(self, value):
+        self.map.total_q_values[self.bin_number] = value
+
+    @property
+    def mean_q_value(self):
+        return self.map.mean_q_values[self.bin_number]
+
+    @mean_q_value.setter
+    def mean_q_value(self, value):
+        self.map.mean_q_values[self.bin_number] = value
+
+    @property
+    def is_legal(self):
+        return self.map.legal_mask[self.bin_number]
+
+    @is_legal.setter
+    def is_legal(self, value):
+        self.map.legal_mask[self.bin_number] = value
+
+    @property
+    def rave_visit_count(self):
+        return self.map.rave_visit_counts[self.bin_number]
+
+    @property
+    def rave_mean_q_value(self):
+        return self.map.rave_mean_q_values[self.bin_number]
+
     def get_action(self):
         return self.map.pool.sample_an_action(self.bin_number)
 
@@ -171,11 +232,35 @@ class DiscreteActionMappingEntry(ActionMappingEntry):
 
         return self.mean_q_value != old_mean_q
 
+    def add_virtual_loss(self, virtual_loss):
+        """
+        Count a pending visit as a loss, so that other workers of a tree-parallel search are
+        steered away from this action until the visit is backed up
+        :param virtual_loss:
+        :return:
+        """
+        self.update_visit_count(1)
+        self.total_q_value -= virtual_loss
+        self.mean_q_value = old_div(self.total_q_value, self.visit_count)
+
+    def remove_virtual_loss(self, virtual_loss):
+        """
+        Undo add_virtual_loss
+        :param virtual_loss:
+        :return:
+        """
+        self.update_visit_count(-1)
+        self.total_q_value += virtual_loss
+        if self.visit_count > 0:
+            self.mean_q_value = old_div(self.total_q_value, self.visit_count)
+        else:
+            self.mean_q_value = 0
+
     def set_legal(self, legal):
         if not self.is_legal:
             if legal:
                 self.is_legal = True
-                if self.visit_count is 0:
+                if self.visit_count == 0:
                     self.map.bin_sequence.add(self.bin_number)
         else:
             if not self.is_legal:
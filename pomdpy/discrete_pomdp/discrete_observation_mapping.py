@@ -5,16 +5,25 @@ class DiscreteObservationMap(ObservationMapping):
     """
     A concrete class implementing ObservationMapping for a discrete set of observations.
     *
-    * The mapping entries are stored in a dictionary, which maps each observation
-    * to its associated entry in the mapping
-    * The dictionary returns None if an observation is not yet stored in the dictionary
+    * The mapping entries are indexed by the dense integer code of their observation, given by the
+    * shared ObservationIndex. When the model has a fixed number of observation codes, the entries
+    * are kept in a list with one slot per code, else in a dictionary keyed by code
+    * Lookups return None if an observation is not yet stored in the mapping
     """
-    def __init__(self, action_node, agent):
+    def __init__(self, action_node, agent, observation_index):
         super(DiscreteObservationMap, self).__init__(action_node)
         self.agent = agent
-        self.child_map = {}
+        self.observation_index = observation_index
+        if observation_index.n_codes is not None:
+            self.children = [None] * observation_index.n_codes
+        else:
+            self.children = {}
         self.total_visit_count = 0
 
+    @property
+    def child_map(self):
+        return dict((entry.observation, entry) for entry in self.get_child_entries())
+
     def get_belief(self, disc_observation):
         entry = self.get_entry(disc_observation)
         if entry is None:
@@ -26,25 +35,28 @@ class DiscreteObservationMap(ObservationMapping):
         entry = DiscreteObservationMapEntry()
         entry.map = self
         entry.observation = disc_observation
+        entry.code = self.observation_index.code(disc_observation)
         entry.child_node = BeliefNode(self.agent, None, entry)
-        self.child_map.__setitem__(entry.observation, entry)
+        self.children[entry.code] = entry
         return entry.child_node
 
     def delete_child(self, obs_mapping_entry):
         self.total_visit_count -= obs_mapping_entry.visit_count
-        del self.child_map[obs_mapping_entry.observation]
+        if isinstance(self.children, dict):
+            del self.children[obs_mapping_entry.code]
+        else:
+            self.children[obs_mapping_entry.code] = None
 
     def get_child_entries(self):
-        return_entries = []
-        for key in list(self.child_map.keys()):
-            return_entries.append(self.child_map.get(key))
-        return return_entries
+        if isinstance(self.children, dict):
+            return list(self.children.values())
+        return [entry for entry in self.children if entry is not None]
 
     def get_entry(self, obs):
-        for i in list(self.child_map.values()):
-            if obs == i.observation:
-                return i
-        return None
+        code = self.observation_index.code(obs)
+        if isinstance(self.children, dict):
+            return self.children.get(code)
+        return self.children[code]
 
 
 class DiscreteObservationMapEntry(ObservationMappingEntry):
@@ -58,6 +70,7 @@ class DiscreteObservationMapEntry(ObservationMappingEntry):
     def __init__(self):
         self.map = None  # DiscreteObservationMap
         self.observation = None     # DiscreteObservation
+        self.code = None    # Code of the observation in the observation index of the map
         # The child node of this entry (should always be non-null).
         self.child_node = None  # belief node
         self.visit_count = 0
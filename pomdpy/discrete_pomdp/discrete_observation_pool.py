@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 from pomdpy.pomdp import ObservationPool
 from .discrete_observation_mapping import DiscreteObservationMap
+from .observation_index import ObservationIndex
 
 
 class DiscreteObservationPool(ObservationPool):
@@ -9,11 +10,12 @@ class DiscreteObservationPool(ObservationPool):
     space.
 
     All of the information is stored inside the individual mapping classes, so this class serves as
-    a simple factory for instances of DiscreteObservationMap.
+    a simple factory for instances of DiscreteObservationMap, which share the pool's observation index.
     """
 
     def __init__(self, agent):
         self.agent = agent
+        self.observation_index = ObservationIndex(agent.model)
 
     def create_observation_mapping(self, action_node):
-        return DiscreteObservationMap(action_node, self.agent)
+        return DiscreteObservationMap(action_node, self.agent, self.observation_index)
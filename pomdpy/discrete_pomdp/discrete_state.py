@@ -7,6 +7,7 @@ class DiscreteState(Point):
     """
     An ABC for a discrete representation of a point in a state space
     """
+    __slots__ = ()
 
     @abc.abstractmethod
     def copy(self):
@@ -0,0 +1,28 @@
+from builtins import object
+import threading
+
+
+class ObservationIndex(object):
+    """
+    Maps discrete observations onto dense integer codes, so that observation mappings can look up
+    their children by indexing instead of comparing observations.
+
+    If the model encodes its observations densely (Model.get_observation_code_count is not None),
+    the codes are the ones returned by Model.encode_observation, and there is a fixed number of them.
+    Otherwise each new observation is interned and assigned the next free code.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.n_codes = model.get_observation_code_count()
+        self.codes = {}
+        self.lock = threading.Lock()
+
+    def code(self, observation):
+        if self.n_codes is not None:
+            return self.model.encode_observation(observation)
+        code = self.codes.get(observation)
+        if code is None:
+            # Interning is guarded, so that tree-parallel threads never hand out the same code twice
+            with self.lock:
+                code = self.codes.setdefault(observation, self.codes.__len__())
+        return code
@@ -7,13 +7,16 @@ from .belief_structure import BeliefStructure
 from .belief_tree import BeliefTree
 from .historical_data import HistoricalData
 from .history import Histories, HistoryEntry, HistorySequence
-from .model import Model, StepResult
+from .model import Model, StepResult, StepResultBatch
 from .observation_mapping import ObservationMapping, ObservationMappingEntry
 from .observation_pool import ObservationPool
+from .particle_filter import ParticleFilter, systematic_resample
+from .particle_set import ParticleSet, kld_sample_size
 from .point import Point
 from .q_table import QTable
 from .statistic import Statistic
 
 __all__ = ['action_mapping', 'action_node', 'action_pool', 'belief_node', 'belief_structure', 'belief_tree',
-           'historical_data', 'history', 'model', 'observation_mapping', 'observation_pool', 'point', 'q_table',
-           'statistic']
+           'historical_data', 'history', 'model', 'observation_mapping', 'observation_pool', 'particle_filter', 'particle_set',
+           'point',
+           'q_table', 'statistic']
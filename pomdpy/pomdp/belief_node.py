@@ -1,5 +1,6 @@
 from builtins import object
 import random
+from pomdpy.util import lock_for
 
 
 class BeliefNode(object):
@@ -24,12 +25,17 @@ class BeliefNode(object):
         self.data = None    # The smart history-based data, to be used for history-based policies.
         self.depth = -1
         self.action_map = None
-        self.state_particles = []   # The set of states that comprise the belief distribution of this belief node
+        # Table of the belief nodes of the tree by transposition key, shared by all of the nodes of the tree
+        self.transpositions = None
+        # The set of states that comprise the belief distribution of this belief node
+        self.state_particles = solver.model.create_particle_set()
 
         if parent_entry is not None:
             self.parent_entry = parent_entry
             # Correctly calculate the depth based on the parent node.
-            self.depth = self.get_parent_belief().depth + 1
+            parent_belief = self.get_parent_belief()
+            self.depth = parent_belief.depth + 1
+            self.transpositions = parent_belief.transpositions
         else:
             self.parent_entry = None
             self.depth = 0
@@ -41,6 +47,7 @@ class BeliefNode(object):
         # share a reference to the action map
         bn.action_map = self.action_map
         bn.state_particles = self.state_particles
+        bn.transpositions = self.transpositions
         return bn
 
     # Randomly select a History Entry
@@ -84,9 +91,11 @@ class BeliefNode(object):
         node = self.action_map.get_action_node(action)
         if node is not None:
             child_node = node.get_child(obs)
-            if child_node is None:
+            # A child without an action map is still being expanded by another worker
+            if child_node is None or child_node.action_map is None:
                 return None
-            child_node.data.update(child_node.get_parent_belief())
+            with lock_for(child_node):
+                child_node.data.update(child_node.get_parent_belief())
             return child_node
         else:
             return None
@@ -100,25 +109,66 @@ class BeliefNode(object):
 
         The belief node will also be added to the flattened node vector of the policy tree, as
         this is done by the BeliefNode constructor.
+
+        Expansion is guarded by a lock on this node, so that concurrent workers in a tree-parallel
+        search never create the same child twice
         :param action:
         :param obs:
         :return: belief node
         """
-        action_node = self.action_map.get_action_node(action)
-        if action_node is None:
-            action_node = self.action_map.create_action_node(action)
-            action_node.set_mapping(self.solver.observation_pool.create_observation_mapping(action_node))
-        child_node, added = action_node.create_or_get_child(obs)
-
-        if added:   # if the child node was added - it is new
-            if self.data is not None:
-                child_node.data = self.data.create_child(action, obs)
-            child_node.action_map = self.solver.action_pool.create_action_mapping(child_node)
-        else:
+        with lock_for(self):
+            action_node = self.action_map.get_action_node(action)
+            if action_node is None:
+                action_node = self.action_map.create_action_node(action)
+                action_node.set_mapping(self.solver.observation_pool.create_observation_mapping(action_node))
+            child_node, added = action_node.create_or_get_child(obs)
+
+            if added:   # if the child node was added - it is new
+                if self.data is not None:
+                    child_node.data = self.data.create_child(action, obs)
+                transposed_node = self.transpose(child_node)
+                if transposed_node is None:
+                    child_node.action_map = self.solver.action_pool.create_action_mapping(child_node)
+                    self.register_transposition(child_node)
+                else:
+                    child_node = transposed_node
+                    added = False
+
+        if not added:
             # Update the current action mapping to reflect the state of the simulation
             # child_node.action_map.update()
             # self.solver.model.num_reused_nodes += 1
 
             # Update the re-used child belief node's data
-            child_node.data.update(child_node.get_parent_belief())
+            with lock_for(child_node):
+                child_node.data.update(child_node.get_parent_belief())
         return child_node, added
+
+    def transpose(self, child_node):
+        """
+        If transpositions are enabled and the tree already has a belief node with the same depth and transposition
+        key as the new child node, point the observation mapping entry of the child to that node instead.
+        Keying by depth too keeps the tree acyclic, so that backups along a simulation path never revisit a node
+        :param child_node: newly created child of this node
+        :return: the existing belief node, or None
+        """
+        key = self.transposition_key(child_node)
+        if key is None:
+            return None
+        node = self.transpositions.get(key)
+        if node is not None:
+            child_node.parent_entry.child_node = node
+        return node
+
+    def register_transposition(self, node):
+        key = self.transposition_key(node)
+        if key is not None:
+            self.transpositions.setdefault(key, node)
+
+    def transposition_key(self, node):
+        if self.transpositions is None or node.data is None:
+            return None
+        key = node.data.transposition_key()
+        if key is None:
+            return None
+        return node.depth, key
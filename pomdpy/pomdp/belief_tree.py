@@ -9,6 +9,10 @@ class BeliefTree(BeliefStructure):
     *
     * Most of the work is done in the individual classes for the mappings and nodes; this class
     * simply owns a root node and handles pruning
+    *
+    * With transpositions enabled, belief nodes at the same depth with the same transposition key are
+    * shared by every action/observation sequence that reaches them, so the tree becomes a directed
+    * acyclic graph
     """
     def __init__(self, agent):
         super(BeliefTree, self).__init__()
@@ -23,6 +27,8 @@ class BeliefTree(BeliefStructure):
         """
         self.prune_tree(self)
         self.root = BeliefNode(self.agent, None, None)
+        if self.agent.model.transpositions:
+            self.root.transpositions = {}
         return self.root
 
     def reset_root_data(self):
@@ -45,6 +51,7 @@ class BeliefTree(BeliefStructure):
     def initialize(self, init_value=None):
         self.reset_root_data()
         self.root.action_map = self.agent.action_pool.create_action_mapping(self.root)
+        self.root.register_transposition(self.root)
 
     def prune_tree(self, bt):
         """
@@ -54,14 +61,20 @@ class BeliefTree(BeliefStructure):
         self.prune_node(bt.root)
         bt.root = None
 
-    def prune_node(self, bn):
+    def prune_node(self, bn, skip=None):
         """
         Remove node bn and all of its descendants from the belief tree
         :param bn:
+        :param skip: set of the ids of the nodes to leave intact. Pruned nodes are added to it, so that
+        shared nodes are only visited once
         :return:
         """
         if bn is None:
             return
+        if skip is not None:
+            if id(bn) in skip:
+                return
+            skip.add(id(bn))
 
         # observation mapping entry
         bn.parent_entry = None
@@ -76,8 +89,8 @@ class BeliefTree(BeliefStructure):
             entry.child_node.parent_entry = None
             entry.map = None
             entry.child_node.observation_map.owner = None
-            for observation_entry in list(entry.child_node.observation_map.child_map.values()):
-                self.prune_node(observation_entry.child_node)
+            for observation_entry in entry.child_node.observation_map.get_child_entries():
+                self.prune_node(observation_entry.child_node, skip)
                 observation_entry.map = None
                 observation_entry.child_node = None
             entry.child_node.observation_map = None
@@ -94,6 +107,12 @@ class BeliefTree(BeliefStructure):
         if bn is None:
             return
 
+        # With transpositions, sibling subtrees may share nodes with the subtree of bn
+        skip = None
+        if bn.transpositions is not None:
+            skip = self.reachable_nodes(bn)
+            self.prune_transpositions(bn.transpositions, skip)
+
         parent_belief = bn.get_parent_belief()
 
         if parent_belief is not None:
@@ -106,4 +125,38 @@ class BeliefTree(BeliefStructure):
 
                     # if the belief node is not the new root of the belief tree, prune it
                     if obs_mapping_entry.child_node is not bn:
-                        self.prune_node(obs_mapping_entry.child_node)
+                        self.prune_node(obs_mapping_entry.child_node, skip)
+
+    @staticmethod
+    def reachable_nodes(bn):
+        """
+        Find the belief nodes reachable from bn. Each of them except bn is re-parented to the observation mapping
+        entry it is first reached through, so that no parent link leads into a pruned subtree
+        :param bn:
+        :return: set of the ids of the belief nodes reachable from bn, including bn
+        """
+        reachable = {id(bn)}
+        stack = [bn]
+        while stack:
+            node = stack.pop()
+            for action_mapping_entry in node.action_map.get_child_entries():
+                for obs_mapping_entry in action_mapping_entry.child_node.observation_map.get_child_entries():
+                    child_node = obs_mapping_entry.child_node
+                    if id(child_node) not in reachable:
+                        child_node.parent_entry = obs_mapping_entry
+                        reachable.add(id(child_node))
+                        stack.append(child_node)
+        return reachable
+
+    @staticmethod
+    def prune_transpositions(transpositions, reachable):
+        """
+        Drop the nodes that are no longer reachable from the transposition table, in place since the table
+        is shared by all of the nodes
+        :param transpositions:
+        :param reachable: set of the ids of the nodes to keep
+        :return:
+        """
+        for key, node in list(transpositions.items()):
+            if id(node) not in reachable:
+                del transpositions[key]
@@ -16,6 +16,14 @@ class HistoricalData(object):
         :return: HistoricalData
         """
 
+    def transposition_key(self):
+        """
+        Canonical, hashable summary of the belief this data describes. Belief nodes whose data have the same key
+        are merged when transpositions are enabled
+        :return: key, or None if the node should never be merged
+        """
+        return None
+
     @abc.abstractmethod
     def create_child(self, action, observation):
         """
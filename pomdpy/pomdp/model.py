@@ -1,10 +1,19 @@
 from __future__ import print_function
 from builtins import object
+from builtins import range
 import abc
 import random
+import time
+import numpy as np
 from future.utils import with_metaclass
 import pprint
 import os
+from pomdpy.util import console
+from .particle_filter import ParticleFilter
+from .particle_set import ParticleSet
+from .statistic import Statistic
+
+module = "model"
 
 pp = pprint.PrettyPrinter().pprint
 
@@ -31,6 +40,9 @@ class Model(with_metaclass(abc.ABCMeta, object)):
             setattr(self, k, args[k])
         pp(args)
 
+        # Telemetry of the rejection sampling particle refills
+        self.refill_metrics = RefillMetrics()
+
         my_dir = os.path.dirname(__file__)
         self.weight_dir = os.path.join(my_dir, '..', '..', 'experiments', 'pickle_jar')
         self.ckpt_dir = os.path.join(my_dir, '..', '..', 'experiments', 'checkpoints')
@@ -124,6 +136,16 @@ class Model(with_metaclass(abc.ABCMeta, object)):
         :return:
         """
 
+    def create_belief(self):
+        """
+        Return the initial belief of a model that tracks its belief exactly with belief_update, during
+        search. The belief must have a sample_particles(n_particles) method, which the belief tree solvers
+        use to refill the particles of the root instead of generating them from the particles of the
+        previous root. The default implementation returns None, for no exact belief tracking
+        :return:
+        """
+        return None
+
     @abc.abstractmethod
     def get_all_states(self):
         """
@@ -218,13 +240,150 @@ class Model(with_metaclass(abc.ABCMeta, object)):
         :return:
         """
 
+    def create_particle_set(self):
+        """
+        Return an empty container for the state particles of a belief node.
+
+        The default is a list; models whose states are hashable by value and not modified in place
+        can return a ParticleSet, which stores each distinct state once along with its count
+        :return: list, or ParticleSet
+        """
+        return []
+
+    def encode_states(self, states):
+        """
+        Pack a sequence of states into the batch representation used by generate_step_batch.
+
+        The default representation is a 1-D object array of the states; models with a vectorized
+        generate_step_batch override this to return a numeric array
+        :param states: sequence of States
+        :return: np.array
+        """
+        batch = np.empty(states.__len__(), dtype=object)
+        for k, state in enumerate(states):
+            batch[k] = state
+        return batch
+
+    def decode_states(self, batch):
+        """
+        Inverse of encode_states
+        :param batch:
+        :return: list of States
+        """
+        return list(batch)
+
+    def encode_observation(self, observation):
+        """
+        Return the code of an observation in the observation arrays of generate_step_batch
+        :param observation:
+        :return:
+        """
+        return observation
+
+    def get_observation_code_count(self):
+        """
+        Number of observation codes, if encode_observation maps every observation to one of the integers
+        0, ..., count - 1. Discrete observation mappings then keep their children in fixed-size lists
+        indexed by the code
+        :return: int, or None if the observations are not encoded densely
+        """
+        return None
+
+    def legal_action_mask_batch(self, states):
+        """
+        Return the legal actions of a batch of states as a mask over action bin numbers.
+
+        The default implementation loops over get_legal_actions
+        :param states: batch of states, as returned by encode_states
+        :return: np.array of shape (len(states), number of actions) of bool
+        """
+        mask = np.zeros((states.__len__(), self.get_all_actions().__len__()), dtype=bool)
+        for k, state in enumerate(self.decode_states(states)):
+            for action in self.get_legal_actions(state):
+                mask[k, getattr(action, 'bin_number', action)] = True
+        return mask
+
+    def generate_step_batch(self, states, actions):
+        """
+        Batched version of generate_step, for a batch of states and the action bin numbers to take from
+        each of them (a single bin number is applied to every state).
+
+        The default implementation loops over generate_step; models override it with a vectorized
+        implementation working directly on their state arrays
+        :param states: batch of states, as returned by encode_states
+        :param actions: np.array of action bin numbers, or a single action bin number
+        :return: StepResultBatch
+        """
+        all_actions = self.get_all_actions()
+        actions = np.broadcast_to(np.asarray(actions), (states.__len__(),))
+
+        result = StepResultBatch(states.__len__())
+        result.actions = actions
+        next_states = []
+        for k, state in enumerate(self.decode_states(states)):
+            step_result, is_legal = self.generate_step(state, all_actions[actions[k]])
+            next_states.append(step_result.next_state)
+            result.observations[k] = self.encode_observation(step_result.observation)
+            result.rewards[k] = step_result.reward
+            result.is_terminal[k] = step_result.is_terminal
+            result.is_legal[k] = is_legal
+        result.next_states = self.encode_states(next_states)
+        return result
+
+    def observation_likelihood(self, state, action, next_state, observation):
+        """
+        Return the probability of receiving observation after taking action from state and reaching
+        next_state, for the weighted particle filter.
+
+        The default implementation returns None, in which case the particle filter weights each particle
+        by whether or not the generative model produced the observation
+        :param state:
+        :param action:
+        :param next_state:
+        :param observation:
+        :return: float, or None
+        """
+        return None
+
+    def condition_next_state(self, next_state, action, observation):
+        """
+        Make a next state sampled by the generative model consistent with the observation that was
+        actually received, for models whose state depends on the observation. Used by the weighted
+        particle filter; the default implementation returns next_state unchanged
+        :param next_state:
+        :param action:
+        :param observation:
+        :return: State
+        """
+        return next_state
+
+    def value_lower_bound(self, state):
+        """
+        Return a lower bound on the optimal discounted return from state, for the DESPOT solver.
+
+        The default implementation returns None, in which case DESPOT estimates the lower bound with a
+        random rollout of the scenario
+        :param state:
+        :return: float, or None
+        """
+        return None
+
+    def value_upper_bound(self, state):
+        """
+        Return an upper bound on the optimal discounted return from state, for the DESPOT solver.
+        The default implementation returns None; models must override it to be solved with DESPOT
+        :param state:
+        :return: float, or None
+        """
+        return None
+
     def generate_particles(self, previous_belief, action, obs, n_particles, prev_particles):
         """
         Generates new state particles based on the state particles of the previous node,
         * as well as on the action and observation.
         *
-        * The default implementation uses rejection sampling, but this can be overridden to provide
-        * a more efficient implementation.
+        * The default implementation uses rejection sampling, or a weighted particle filter if the
+        * particle_filter option is set, but this can be overridden to provide a more efficient implementation.
         :param previous_belief:
         :param action:
         :param obs:
@@ -239,17 +398,15 @@ class Model(with_metaclass(abc.ABCMeta, object)):
             obs_map = action_node.observation_map
         child_node = obs_map.get_belief(obs)
 
-        while particles.__len__() < n_particles:
-            # sample a random particle
-            state = random.choice(prev_particles)
-
-            # Now generate a step in the model, and compare the observation to the actual observation.
-            # Note that this comparison is done implicitly via the observation mapping, to ensure
-            # that approximate observations are treated cleanly.
-            result, is_legal = self.generate_step(state, action)
-            if obs_map.get_belief(result.observation) is child_node:
-                particles.append(result.next_state)
-        return particles
+        if self.particle_filter:
+            return self.filter_particles([random.choice(prev_particles) for _ in range(n_particles)], action, obs,
+                                         n_particles)
+
+        # Sample a random particle, generate a step in the model, and compare the observation to the actual
+        # observation. Note that this comparison is done implicitly via the observation mapping, to ensure
+        # that approximate observations are treated cleanly.
+        return self.rejection_sample(lambda: random.choice(prev_particles), action,
+                                     lambda observation: obs_map.get_belief(observation) is child_node, n_particles)
 
     def generate_particles_uninformed(self, previous_belief, action, obs, n_particles):
         """
@@ -260,22 +417,92 @@ class Model(with_metaclass(abc.ABCMeta, object)):
         :param n_particles:
         :return:
         """
-        particles = []
+        if self.particle_filter:
+            return self.filter_particles([self.sample_state_uninformed() for _ in range(n_particles)], action, obs,
+                                         n_particles)
+
         obs_map = previous_belief.action_map.get_action_node(action).observation_map
         child_node = obs_map.get_belief(obs)
 
+        # Sample a random particle, generate a step in the model, and compare the observation to the actual
+        # observation. Note that this comparison is done implicitly via the observation mapping, to ensure
+        # that approximate observations are treated cleanly.
+        return self.rejection_sample(self.sample_state_uninformed, action,
+                                     lambda observation: obs_map.get_belief(observation) is child_node, n_particles)
+
+    def rejection_sample(self, sample_state, action, accept_observation, n_particles):
+        """
+        Rejection sampling of the next states of action, within the max_refill_attempts and refill_timeout
+        budgets. The attempts, accepted particles and elapsed time are recorded in refill_metrics
+        :param sample_state: function returning a state to step from
+        :param action:
+        :param accept_observation: function returning whether or not to keep the next state of a step, given
+        its observation
+        :param n_particles: number of particles wanted
+        :return: list of particles, with fewer than n_particles particles if the budget ran out
+        """
+        particles = []
+        attempts = 0
+        start_time = time.time()
+
         while particles.__len__() < n_particles:
-            # sample a random particle
-            state = self.sample_state_uninformed()
-
-            # Now generate a step in the model, and compare the observation to the actual observation.
-            # Note that this comparison is done implicitly via the observation mapping, to ensure
-            # that approximate observations are treated cleanly.
-            result, is_legal = self.generate_step(state, action)
-            if obs_map.get_belief(result.observation) is child_node:
+            if attempts >= self.max_refill_attempts or time.time() - start_time > self.refill_timeout:
+                break
+            attempts += 1
+            result, is_legal = self.generate_step(sample_state(), action)
+            if accept_observation(result.observation):
                 particles.append(result.next_state)
+
+        self.refill_metrics.record(attempts, particles.__len__(), time.time() - start_time,
+                                   particles.__len__() < n_particles)
         return particles
 
+    def filter_particles(self, particles, action, obs, n_particles):
+        """
+        Weighted particle filter update of particles with action and obs
+        :param particles: list of states
+        :param action:
+        :param obs:
+        :param n_particles: number of particles to resample
+        :return: list of particles, empty if none of the particles is consistent with obs
+        """
+        particle_filter = ParticleFilter(self, particles)
+        particle_filter.predict(action, obs)
+        return particle_filter.resample(n_particles)
+
+
+class RefillMetrics(object):
+    """
+    Attempts, accepted particles and elapsed time of each rejection sampling particle refill
+    """
+    def __init__(self):
+        self.attempts = Statistic('refill attempts')
+        self.accepts = Statistic('refill accepts')
+        self.time = Statistic('refill time')
+        # Number of refills that ran out of budget before generating all of the particles
+        self.n_exhausted = 0
+
+    def record(self, attempts, accepts, elapsed, exhausted):
+        self.attempts.add(attempts)
+        self.accepts.add(accepts)
+        self.time.add(elapsed)
+        if exhausted:
+            self.n_exhausted += 1
+            console(2, module, 'Particle refill ran out of budget: ' + str(accepts) + ' particles accepted out of ' +
+                    str(attempts) + ' attempts in ' + str(elapsed) + ' secs')
+        else:
+            console(4, module, 'Particle refill: ' + str(accepts) + ' particles accepted out of ' + str(attempts) +
+                    ' attempts in ' + str(elapsed) + ' secs')
+
+    def acceptance_rate(self):
+        if self.attempts.running_total == 0:
+            return 0.0
+        return self.accepts.running_total / self.attempts.running_total
+
+    def to_string(self):
+        return 'refills: ' + str(int(self.attempts.count)) + ' acceptance rate: ' + str(self.acceptance_rate()) + \
+               ' ave time/refill: ' + str(self.time.mean) + ' out of budget: ' + str(self.n_exhausted)
+
 
 class StepResult(object):
     """
@@ -304,3 +531,22 @@ class StepResult(object):
         self.next_state.print_state()
         print("Is terminal: ", end=' ')
         print(self.is_terminal)
+
+
+class StepResultBatch(object):
+    """
+    The results of a batch of steps in the model, as parallel arrays.
+
+    Next states are in the batch representation of the model (see Model.encode_states) and
+    observations are the codes returned by Model.encode_observation
+    """
+    def __init__(self, n_steps=0):
+        self.actions = np.zeros(n_steps, dtype=int)
+        self.observations = np.empty(n_steps, dtype=object)
+        self.rewards = np.zeros(n_steps)
+        self.next_states = None
+        self.is_terminal = np.zeros(n_steps, dtype=bool)
+        self.is_legal = np.ones(n_steps, dtype=bool)
+
+    def __len__(self):
+        return self.rewards.__len__()
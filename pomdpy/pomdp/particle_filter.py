@@ -0,0 +1,72 @@
+from __future__ import division
+from builtins import range
+from builtins import object
+import numpy as np
+
+
+def systematic_resample(weights, n_samples):
+    """
+    Systematic (low-variance) resampling: a single uniform offset places n_samples evenly spaced
+    pointers on the cumulative weights
+    :param weights: np.array of non-negative weights, not necessarily normalized
+    :param n_samples:
+    :return: np.array of the n_samples indices drawn
+    """
+    cumulative_weights = np.cumsum(weights)
+    pointers = (np.random.uniform(0, 1) + np.arange(n_samples)) * (cumulative_weights[-1] / n_samples)
+    return np.minimum(np.searchsorted(cumulative_weights, pointers, side='right'), weights.__len__() - 1)
+
+
+class ParticleFilter(object):
+    """
+    A weighted particle belief. The particles and their importance weights are stored as arrays.
+
+    Each update propagates every particle through the generative model once, conditions the next
+    state on the observation received (Model.condition_next_state) and multiplies its weight by
+    the likelihood of the observation (Model.observation_likelihood). A new, unweighted particle set
+    is then drawn by systematic resampling, so the cost of a belief update is bounded by the number
+    of particles rather than by the probability of the observation.
+    """
+    def __init__(self, model, particles, weights=None):
+        self.model = model
+        self.particles = np.empty(particles.__len__(), dtype=object)
+        for k, particle in enumerate(particles):
+            self.particles[k] = particle
+        if weights is None:
+            self.weights = np.ones(self.particles.__len__())
+        else:
+            self.weights = np.array(weights, dtype=float)
+
+    def total_weight(self):
+        return self.weights.sum()
+
+    def predict(self, action, observation):
+        """
+        Propagate the particles through a step of the model with action, and reweight them by the
+        likelihood of observation
+        :param action:
+        :param observation:
+        :return: the total weight of the particles
+        """
+        for k in range(0, self.particles.__len__()):
+            state = self.particles[k]
+            step_result, is_legal = self.model.generate_step(state, action)
+            next_state = self.model.condition_next_state(step_result.next_state, action, observation)
+            likelihood = self.model.observation_likelihood(state, action, next_state, observation)
+            if likelihood is None:
+                # No likelihood for this model: keep the particles that produced the observation
+                likelihood = 1. if step_result.observation == observation else 0.
+            self.particles[k] = next_state
+            self.weights[k] *= likelihood
+        return self.total_weight()
+
+    def resample(self, n_particles):
+        """
+        Draw n_particles unweighted particles with systematic resampling
+        :param n_particles:
+        :return: list of new state particles, empty if all of the particles have zero weight
+        """
+        if self.particles.__len__() == 0 or self.total_weight() <= 0:
+            return []
+        # States may be modified in place by the model, so resampled duplicates must be distinct objects
+        return [self.particles[k].copy() for k in systematic_resample(self.weights, n_particles)]
@@ -0,0 +1,76 @@
+from builtins import range
+from builtins import object
+import numpy as np
+
+
+def kld_sample_size(n_bins, epsilon, quantile):
+    """
+    KLD-sampling bound (Fox, 2003) on the number of particles needed so that, with probability 1 - delta,
+    the KL divergence between the particle approximation and the true belief is at most epsilon
+    :param n_bins: number of distinct states (histogram bins) the particles occupy
+    :param epsilon: maximum KL divergence
+    :param quantile: upper 1 - delta quantile of the standard normal distribution
+    :return: the required number of particles, 0 for a belief concentrated on a single state
+    """
+    if n_bins < 2:
+        return 0
+    a = 2. / (9. * (n_bins - 1))
+    return int(np.ceil((n_bins - 1) / (2. * epsilon) * (1. - a + np.sqrt(a) * quantile) ** 3))
+
+
+class ParticleSet(object):
+    """
+    A multiset of state particles, storing each distinct state once along with its multiplicity.
+
+    It supports the list operations used on the state particles of a belief node (append, +=, len,
+    iteration and integer indexing), so that random.choice samples a state in proportion to its
+    count, exactly as it would from the equivalent list. States must be hashable by value, and must
+    not be modified after they are added. Particles may be sampled while another thread appends.
+    """
+    def __init__(self, particles=None):
+        self.states = []    # The distinct states
+        self.counts = []    # The multiplicity of each of the distinct states
+        self.index = {}     # Position of each of the distinct states in self.states
+        # Position in self.states of the k-th particle, so that indexing is a single lookup. It is
+        # extended as particles are added, instead of rebuilding cumulative counts after every change
+        self.positions = []
+        if particles is not None:
+            self.extend(particles)
+
+    def append(self, state, count=1):
+        position = self.index.get(state)
+        if position is None:
+            position = self.states.__len__()
+            self.states.append(state)
+            self.counts.append(count)
+            self.index[state] = position
+        else:
+            self.counts[position] += count
+        # The particles are published last, by a single list operation, so that the unlocked reads of
+        # sample_particle in a tree-parallel search never see a particle whose state is not stored yet
+        if count == 1:
+            self.positions.append(position)
+        else:
+            self.positions.extend([position] * count)
+
+    def extend(self, particles):
+        for state in particles:
+            self.append(state)
+
+    def __iadd__(self, particles):
+        self.extend(particles)
+        return self
+
+    def __len__(self):
+        return self.positions.__len__()
+
+    def __getitem__(self, k):
+        return self.states[self.positions[k]]
+
+    def __iter__(self):
+        for state, count in zip(self.states, self.counts):
+            for _ in range(count):
+                yield state
+
+    def distinct_count(self):
+        return self.states.__len__()
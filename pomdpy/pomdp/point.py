@@ -8,6 +8,7 @@ class Point(with_metaclass(abc.ABCMeta, object)):
     Interface for a point-set topology. Each point is an element of a set of points
     i.e. the set of all actions for a given POMDP
     """
+    __slots__ = ()
 
     @abc.abstractmethod
     def copy(self):
@@ -2,7 +2,9 @@ from __future__ import absolute_import
 from .solver import Solver
 from .belief_tree_solver import BeliefTreeSolver
 from .pomcp import POMCP
+from .despot import DESPOT
 from .value_iteration import ValueIteration
-from .alpha_vector import AlphaVector
+from .incremental_pruning import IncrementalPruning
+from .alpha_vector import AlphaVector, AlphaVectorSet
 
-__all__ = ['solver', 'belief_tree_solver', 'pomcp', 'value_iteration', 'AlphaVector']
+__all__ = ['solver', 'belief_tree_solver', 'pomcp', 'despot', 'value_iteration', 'incremental_pruning', 'AlphaVector', 'AlphaVectorSet']
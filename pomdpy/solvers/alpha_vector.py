@@ -1,3 +1,8 @@
+from builtins import range
+from builtins import object
+import numpy as np
+
+
 class AlphaVector:
     """
     Simple wrapper for an alpha vector, used for representing the value function for a POMDP as a piecewise-linear,
@@ -9,3 +14,136 @@ class AlphaVector:
 
     def copy(self):
         return AlphaVector(self.action, self.v)
+
+
+class AlphaVectorSet(object):
+    """
+    Set of alpha vectors stored as a contiguous (n_vectors, n_states) matrix, along with the action of each
+    vector, so that the value function can be evaluated at many beliefs with a single matrix product.
+
+    The storage grows by doubling, so appending a vector is amortized constant time. Iterating over the set
+    or indexing it yields AlphaVector views of the rows
+    """
+    def __init__(self, n_states, vectors=None, actions=None):
+        """
+        :param n_states:
+        :param vectors: optional (n_vectors, n_states) array of initial vectors
+        :param actions: optional array of the actions of the initial vectors
+        """
+        self._vectors = np.empty((4, n_states))
+        self._actions = np.empty(4, dtype=np.int64)
+        self.n_vectors = 0
+        if vectors is not None:
+            self.extend(actions, vectors)
+
+    @staticmethod
+    def from_alpha_vectors(alpha_vectors, n_states=None):
+        """
+        :param alpha_vectors: iterable of AlphaVector, e.g. a set of AlphaVector loaded from an older pickle
+        :param n_states: required if alpha_vectors is empty
+        :return: AlphaVectorSet
+        """
+        if isinstance(alpha_vectors, AlphaVectorSet):
+            return alpha_vectors
+        alpha_vectors = list(alpha_vectors)
+        if n_states is None:
+            if alpha_vectors.__len__() == 0:
+                raise ValueError('n_states is required to build an empty AlphaVectorSet')
+            n_states = alpha_vectors[0].v.__len__()
+        vector_set = AlphaVectorSet(n_states)
+        if alpha_vectors.__len__() > 0:
+            vector_set.extend([av.action for av in alpha_vectors], [av.v for av in alpha_vectors])
+        return vector_set
+
+    @property
+    def n_states(self):
+        return self._vectors.shape[1]
+
+    @property
+    def vectors(self):
+        """
+        (n_vectors, n_states) view of the vectors
+        """
+        return self._vectors[:self.n_vectors]
+
+    @property
+    def actions(self):
+        """
+        (n_vectors,) view of the actions of the vectors
+        """
+        return self._actions[:self.n_vectors]
+
+    def __len__(self):
+        return self.n_vectors
+
+    def __getitem__(self, index):
+        return AlphaVector(a=int(self.actions[index]), v=self.vectors[index])
+
+    def __iter__(self):
+        for index in range(self.n_vectors):
+            yield self[index]
+
+    def copy(self):
+        return AlphaVectorSet(self.n_states, self.vectors.copy(), self.actions.copy())
+
+    def reserve(self, n_vectors):
+        """
+        Grow the storage, by doubling, to hold at least n_vectors vectors
+        :param n_vectors:
+        :return:
+        """
+        capacity = self._actions.__len__()
+        if n_vectors <= capacity:
+            return
+        while capacity < n_vectors:
+            capacity *= 2
+        vectors = np.empty((capacity, self.n_states))
+        vectors[:self.n_vectors] = self.vectors
+        actions = np.empty(capacity, dtype=np.int64)
+        actions[:self.n_vectors] = self.actions
+        self._vectors, self._actions = vectors, actions
+
+    def append(self, action, v):
+        self.reserve(self.n_vectors + 1)
+        self._vectors[self.n_vectors] = v
+        self._actions[self.n_vectors] = action
+        self.n_vectors += 1
+
+    def extend(self, actions, vectors):
+        """
+        Append a batch of vectors
+        :param actions: action of each vector, or a single action for all of them
+        :param vectors: (n, n_states) array
+        :return:
+        """
+        vectors = np.asarray(vectors, dtype=float).reshape(-1, self.n_states)
+        n = vectors.__len__()
+        self.reserve(self.n_vectors + n)
+        self._vectors[self.n_vectors:self.n_vectors + n] = vectors
+        self._actions[self.n_vectors:self.n_vectors + n] = actions
+        self.n_vectors += n
+
+    def subset(self, indices):
+        """
+        :param indices: indices, or boolean mask, of the vectors to keep
+        :return: new AlphaVectorSet
+        """
+        return AlphaVectorSet(self.n_states, self.vectors[indices], self.actions[indices])
+
+    def values(self, beliefs):
+        """
+        :param beliefs: (n_beliefs, n_states) array, or a single belief
+        :return: (n_beliefs, n_vectors) array of the value of every vector at every belief
+        """
+        return np.dot(np.asarray(beliefs, dtype=float), self.vectors.T)
+
+    def best_vectors(self, beliefs):
+        """
+        :param beliefs: (n_beliefs, n_states) array, or a single belief
+        :return: index of the best vector at each belief, and the value of the beliefs
+        """
+        if self.n_vectors == 0:
+            raise ValueError('Vector set should not be empty')
+        values = self.values(beliefs)
+        best = np.argmax(values, axis=-1)
+        return best, np.take_along_axis(values, np.expand_dims(best, -1), axis=-1)[..., 0]
@@ -1,15 +1,90 @@
 from builtins import str
 from builtins import range
+from past.utils import old_div
 import time
 import random
 import abc
+import multiprocessing
+import threading
+import numpy as np
+from scipy.stats import norm
 from pomdpy.util import console
+from pomdpy.pomdp.particle_set import kld_sample_size
 from pomdpy.pomdp.belief_tree import BeliefTree
+from pomdpy.discrete_pomdp import ArrayBeliefTree
 from pomdpy.solvers import Solver
 
 module = "BeliefTreeSolver"
 
 
+def _fork_context():
+    """
+    Worker processes must be forked so that they inherit a copy of the current belief tree
+    :return:
+    """
+    try:
+        return multiprocessing.get_context('fork')
+    except AttributeError:
+        # Python 2 always forks on POSIX
+        return multiprocessing
+
+
+def _root_parallel_worker(solver, connection):
+    """
+    Serve the requests of the solver process to a root-parallel worker, which owns the forked copy of the
+    solver. A request is ('search', (seed, n_sims, eps, start_time)), answered with the change in the root
+    action statistics, ('update', (step_result, prune)), which is not answered, or None to stop.
+
+    An error raised by an update is sent back in answer to the next search
+    :param solver:
+    :param connection:
+    :return:
+    """
+    error = None
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        command, args = request
+        try:
+            if command == 'update':
+                if error is None:
+                    solver.update(*args)
+            elif error is not None:
+                connection.send(error)
+            else:
+                connection.send(_root_parallel_search(solver, *args))
+        except Exception as e:
+            error = e
+            if command == 'search':
+                connection.send(error)
+    connection.close()
+
+
+def _root_parallel_search(solver, seed, n_sims, eps, start_time):
+    """
+    Grow the worker's copy of the belief tree and return the change in the root action statistics
+    :return:
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    if solver.disable_tree:
+        # The worker's tree has no node for the current belief
+        return {}
+
+    # The root keeps the statistics of the previous searches, so only report this search's contribution
+    before = solver.root_statistics()
+    solver.run_simulations(n_sims, eps, start_time)
+    after = solver.root_statistics()
+
+    delta = {}
+    for bin_number, (visit_count, total_q_value) in after.items():
+        old_visit_count, old_total_q_value = before.get(bin_number, (0, 0))
+        if visit_count != old_visit_count:
+            delta[bin_number] = (visit_count - old_visit_count, total_q_value - old_total_q_value)
+    return delta
+
+
 class BeliefTreeSolver(Solver):
     """
     All POMDP solvers must implement the abstract methods specified below
@@ -24,8 +99,21 @@ class BeliefTreeSolver(Solver):
         self.history = agent.histories.create_sequence()
         # flag for determining whether the solver is an on/off-policy learning algorithm
         self.disable_tree = False
-
-        self.belief_tree = BeliefTree(agent)
+        # Virtual loss applied to action mapping entries while a tree-parallel search is running
+        self.virtual_loss = 0
+        # (process, connection) of each root-parallel worker, forked by the first root-parallel search
+        self.workers = None
+        # Standard normal quantile of the KLD-sampling bound on the particle count of a belief node
+        self.kld_quantile = norm.ppf(1. - self.model.kld_delta) if self.model.kld_sampling else None
+
+        if self.model.tree_backend == 'array':
+            if self.model.n_workers > 1 and self.model.parallel == 'tree':
+                raise ValueError('Tree-parallel search is not supported by the array belief tree')
+            if self.model.transpositions:
+                raise ValueError('Transpositions are not supported by the array belief tree')
+            self.belief_tree = ArrayBeliefTree(agent)
+        else:
+            self.belief_tree = BeliefTree(agent)
 
         # Initialize the Belief Tree
         self.belief_tree.reset()
@@ -39,6 +127,58 @@ class BeliefTreeSolver(Solver):
 
         self.belief_tree_index = self.belief_tree.root.copy()
 
+        # Exact belief of the current root, for models that track it. The particle filter and rejection
+        # sampling refills work from the particles of the previous root instead
+        if self.model.approximate_belief or self.model.particle_filter:
+            self.belief = None
+        else:
+            self.belief = self.model.create_belief()
+
+    def particle_budget(self, particles):
+        """
+        Number of state particles a belief node should hold. With KLD sampling the budget follows the number of
+        distinct states among the particles, clamped to [min_particle_count, max_particle_count], so that
+        concentrated beliefs keep fewer particles than diffuse ones. Particle containers that do not count their
+        distinct states (plain lists) always get max_particle_count
+        :param particles: state particles of the belief node
+        :return:
+        """
+        if self.kld_quantile is None or not hasattr(particles, 'distinct_count'):
+            return self.model.max_particle_count
+        n_particles = kld_sample_size(particles.distinct_count(), self.model.kld_epsilon, self.kld_quantile)
+        return max(self.model.min_particle_count, min(self.model.max_particle_count, n_particles))
+
+    @staticmethod
+    def widening_limit(coefficient, exponent, n_visits):
+        """
+        Max number of children progressive widening allows a node that has been visited n_visits times
+        :param coefficient: k
+        :param exponent: alpha
+        :param n_visits: N
+        :return: ceil(k * N^alpha), at least 1
+        """
+        return max(1, int(np.ceil(coefficient * n_visits ** exponent)))
+
+    def widen_observation(self, action_mapping_entry, observation):
+        """
+        Observation progressive widening. Once the action node of action_mapping_entry has as many observation
+        children as widening_limit allows for the visit count of the action, a new observation is routed to the
+        existing child whose observation is closest to it
+        :param action_mapping_entry:
+        :param observation: observation that does not have a child yet
+        :return: belief node, or None if a new child may be created for the observation
+        """
+        if self.model.observation_widening <= 0 or action_mapping_entry.child_node is None:
+            return None
+        # Skip children that are still being expanded by another worker
+        entries = [entry for entry in action_mapping_entry.child_node.observation_map.get_child_entries()
+                   if entry.child_node.action_map is not None]
+        if entries.__len__() == 0 or entries.__len__() < self.widening_limit(self.model.observation_widening,
+                                                                           self.model.observation_widening_exponent,
+                                                                           action_mapping_entry.visit_count):
+            return None
+        return min(entries, key=lambda entry: observation.distance_to(entry.observation)).child_node
+
     def monte_carlo_approx(self, eps, start_time):
         """
         Approximate Q(b, pi(b)) via monte carlo simulations, where b is the belief node pointed to by
@@ -50,11 +190,142 @@ class BeliefTreeSolver(Solver):
         :param start_time
         :return:
         """
-        for i in range(self.model.n_sims):
+        if self.model.n_workers > 1:
+            if self.model.parallel == 'tree':
+                self.tree_parallel_approx(eps, start_time)
+            else:
+                self.root_parallel_approx(eps, start_time)
+        else:
+            self.run_simulations(self.model.n_sims, eps, start_time)
+
+    def run_simulations(self, n_sims, eps, start_time):
+        """
+        Run n_sims simulations from the belief node pointed to by the belief tree index
+        :param n_sims:
+        :param eps:
+        :param start_time:
+        :return:
+        """
+        for i in range(n_sims):
             # Reset the Simulator
             self.model.reset_for_simulation()
             self.simulate(self.belief_tree_index, eps, start_time)
 
+    def root_parallel_approx(self, eps, start_time):
+        """
+        Root-parallel version of monte_carlo_approx. The simulation budget is split between this process and
+        n_workers - 1 worker processes. The workers are forked by the first search of the epoch and reused by
+        the following ones; each grows its own copy of the belief tree from the current belief, and the
+        visit counts and total Q values of the root action mapping entries are merged back into this
+        solver's tree before an action is selected.
+
+        This process keeps its share of the simulations so that its own tree is still expanded below the root
+        :param eps:
+        :param start_time:
+        :return:
+        """
+        n_workers = self.model.n_workers
+        n_sims = [self.model.n_sims // n_workers] * n_workers
+        for i in range(self.model.n_sims % n_workers):
+            n_sims[i] += 1
+
+        if self.workers is None:
+            self.fork_workers(n_workers - 1)
+
+        # Forked workers start with identical RNG states, so give each its own seed
+        seeds = np.random.randint(0, 2 ** 31 - 1, size=n_workers - 1)
+        for i, (process, connection) in enumerate(self.workers):
+            connection.send(('search', (int(seeds[i]), n_sims[i + 1], eps, start_time)))
+        self.run_simulations(n_sims[0], eps, start_time)
+        worker_statistics = [connection.recv() for process, connection in self.workers]
+
+        for statistics in worker_statistics:
+            if isinstance(statistics, Exception):
+                raise statistics
+        for statistics in worker_statistics:
+            self.merge_root_statistics(statistics)
+
+    def fork_workers(self, n_processes):
+        """
+        Fork the root-parallel worker processes. Each one keeps its own copy of the belief tree for the rest
+        of the epoch, which follows the real episode through the step results that update sends to it
+        :param n_processes:
+        :return:
+        """
+        context = _fork_context()
+        workers = []
+        for i in range(n_processes):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=_root_parallel_worker, args=(self, worker_connection))
+            process.daemon = True
+            process.start()
+            worker_connection.close()
+            workers.append((process, connection))
+        self.workers = workers
+
+    def close(self):
+        """
+        Stop the root-parallel worker processes, if any. Called at the end of each epoch
+        :return:
+        """
+        if self.workers is None:
+            return
+        for process, connection in self.workers:
+            connection.send(None)
+            connection.close()
+        for process, connection in self.workers:
+            process.join()
+        self.workers = None
+
+    def tree_parallel_approx(self, eps, start_time):
+        """
+        Tree-parallel version of monte_carlo_approx. n_workers threads descend the same belief tree
+        concurrently. While a simulation is in flight, each action mapping entry on its path carries a
+        virtual loss, so that the other workers spread out over the tree instead of following the same path.
+
+        Threads only run in parallel on a free-threaded interpreter; with the GIL the search is interleaved
+        :param eps:
+        :param start_time:
+        :return:
+        """
+        n_workers = self.model.n_workers
+        n_sims = [self.model.n_sims // n_workers] * n_workers
+        for i in range(self.model.n_sims % n_workers):
+            n_sims[i] += 1
+
+        self.virtual_loss = self.model.virtual_loss
+        workers = [threading.Thread(target=self.run_simulations, args=(n_sims[i], eps, start_time))
+                   for i in range(n_workers)]
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            self.virtual_loss = 0
+
+    def root_statistics(self):
+        """
+        :return: dict mapping the bin number of each visited root action to its (visit count, total Q value)
+        """
+        statistics = {}
+        for entry in self.belief_tree_index.action_map.get_visited_entries():
+            statistics[entry.bin_number] = (entry.visit_count, entry.total_q_value)
+        return statistics
+
+    def merge_root_statistics(self, statistics):
+        """
+        Add the visit counts and total Q values computed by another search to the root action mapping entries
+        :param statistics: dict mapping bin numbers to (visit count, total Q value)
+        :return:
+        """
+        action_map = self.belief_tree_index.action_map
+        for bin_number, (visit_count, total_q_value) in statistics.items():
+            entry = action_map.get_entry(bin_number)
+            entry.update_visit_count(visit_count)
+            entry.total_q_value += total_q_value
+            entry.mean_q_value = old_div(entry.total_q_value, entry.visit_count)
+
     @abc.abstractmethod
     def simulate(self, belief, eps, start_time):
         """
@@ -120,12 +391,16 @@ class BeliefTreeSolver(Solver):
             action_mapping_entry.update_visit_count(1)
             action_mapping_entry.update_q_value(q_value)
 
-    def rollout(self, belief_node):
+    def rollout(self, belief_node, rave_actions=None):
         """
         Iterative random rollout search to finish expanding the episode starting at belief_node
         :param belief_node:
+        :param rave_actions: optional mask over bin numbers, in which the actions taken are marked
         :return:
         """
+        if self.model.rollout_particles > 1:
+            return self.batch_rollout(belief_node, self.model.rollout_particles, rave_actions)
+
         legal_actions = belief_node.data.generate_legal_actions()
 
         if not isinstance(legal_actions, list):
@@ -139,6 +414,8 @@ class BeliefTreeSolver(Solver):
 
         while num_steps < self.model.max_depth and not is_terminal:
             legal_action = random.choice(legal_actions)
+            if rave_actions is not None:
+                rave_actions[getattr(legal_action, 'bin_number', legal_action)] = True
             step_result, is_legal = self.model.generate_step(state, legal_action)
             is_terminal = step_result.is_terminal
             discounted_reward_sum += step_result.reward * discount
@@ -151,6 +428,48 @@ class BeliefTreeSolver(Solver):
 
         return discounted_reward_sum
 
+    def batch_rollout(self, belief_node, n_particles, rave_actions=None):
+        """
+        Random rollouts of a batch of state particles of belief_node, simulated in lockstep with the batched
+        generative model of the model
+        :param belief_node:
+        :param n_particles: number of particles to roll out
+        :param rave_actions: optional mask over bin numbers, in which the actions taken by any of the rollouts
+        are marked
+        :return: mean discounted return of the rollouts
+        """
+        particles = belief_node.state_particles
+        states = self.model.encode_states([particles[k] for k in
+                                           np.random.randint(particles.__len__(), size=n_particles)])
+
+        # The first action is drawn from the legal actions of the belief node, as in rollout
+        legal_mask = np.zeros((n_particles, self.model.get_all_actions().__len__()), dtype=bool)
+        legal_mask[:, list(belief_node.data.generate_legal_actions())] = True
+
+        discounted_reward_sums = np.zeros(n_particles)
+        discount = 1.0
+        num_steps = 0
+        # Indices of the rollouts that have not reached a terminal state
+        running = np.arange(n_particles)
+
+        while num_steps < self.model.max_depth and running.size > 0:
+            # Draw a legal action uniformly at random for each rollout
+            legal_actions = np.argmax(np.where(legal_mask, np.random.random(legal_mask.shape), -1.), axis=1)
+            if rave_actions is not None:
+                rave_actions[legal_actions] = True
+            step_results = self.model.generate_step_batch(states, legal_actions)
+            discounted_reward_sums[running] += step_results.rewards * discount
+            discount *= self.model.discount
+            # advance to next states, dropping the rollouts that terminated
+            not_terminal = ~step_results.is_terminal
+            running = running[not_terminal]
+            states = step_results.next_states[not_terminal]
+            # generate new legal action masks from the new states
+            legal_mask = self.model.legal_action_mask_batch(states)
+            num_steps += 1
+
+        return discounted_reward_sums.mean()
+
     def update(self, step_result, prune=True):
         """
         Feed back the step result, updating the belief_tree,
@@ -160,10 +479,18 @@ class BeliefTreeSolver(Solver):
 
         :return:
         """
+        # Keep the belief trees of the root-parallel workers at the same belief node
+        if self.workers is not None:
+            for process, connection in self.workers:
+                connection.send(('update', (step_result, prune)))
+
         # Update the Simulator with the Step Result
         # This is important in case there are certain actions that change the state of the simulator
         self.model.update(step_result)
 
+        if self.belief is not None:
+            self.belief = self.model.belief_update(self.belief, step_result.action, step_result.observation)
+
         child_belief_node = self.belief_tree_index.get_child(step_result.action, step_result.observation)
 
         # If the child_belief_node is None because the step result randomly produced a different observation,
@@ -176,7 +503,7 @@ class BeliefTreeSolver(Solver):
                 self.disable_tree = True
                 return
 
-            obs_mapping_entries = list(action_node.observation_map.child_map.values())
+            obs_mapping_entries = action_node.observation_map.get_child_entries()
 
             for entry in obs_mapping_entries:
                 if entry.child_node is not None:
@@ -184,22 +511,33 @@ class BeliefTreeSolver(Solver):
                     console(2, module, "Had to grab nearest belief node...variance added")
                     break
 
-        # If the new root does not yet have the max possible number of particles add some more
-        if child_belief_node.state_particles.__len__() < self.model.max_particle_count:
+        # If the new root does not yet have its budget of particles add some more. The budget is recomputed as
+        # particles are added, since with KLD sampling it grows with the number of distinct states they cover
+        budget = self.particle_budget(child_belief_node.state_particles)
+        while child_belief_node.state_particles.__len__() < budget:
 
-            num_to_add = self.model.max_particle_count - child_belief_node.state_particles.__len__()
+            num_to_add = budget - child_belief_node.state_particles.__len__()
 
-            # Generate particles for the new root node
-            child_belief_node.state_particles += self.model.generate_particles(self.belief_tree_index, step_result.action,
-                                                                               step_result.observation, num_to_add,
-                                                                               self.belief_tree_index.state_particles)
-
-            # If that failed, attempt to create a new state particle set
-            if child_belief_node.state_particles.__len__() == 0:
-                child_belief_node.state_particles += self.model.generate_particles_uninformed(self.belief_tree_index,
-                                                                                              step_result.action,
-                                                                                              step_result.observation,
-                                                                                        self.model.min_particle_count)
+            # Sample the particles from the exact belief if there is one, else generate them for the new root node
+            if self.belief is not None:
+                new_particles = self.belief.sample_particles(num_to_add)
+            else:
+                new_particles = self.model.generate_particles(self.belief_tree_index, step_result.action,
+                                                              step_result.observation, num_to_add,
+                                                              self.belief_tree_index.state_particles)
+            child_belief_node.state_particles += new_particles
+
+            # Stop when the refill ran out of attempts or time
+            if new_particles.__len__() < num_to_add:
+                break
+            budget = self.particle_budget(child_belief_node.state_particles)
+
+        # If that failed, attempt to create a new state particle set
+        if child_belief_node.state_particles.__len__() == 0:
+            child_belief_node.state_particles += self.model.generate_particles_uninformed(self.belief_tree_index,
+                                                                                          step_result.action,
+                                                                                          step_result.observation,
+                                                                                          self.model.min_particle_count)
 
         # Failed to continue search- ran out of particles
         if child_belief_node is None or child_belief_node.state_particles.__len__() == 0:
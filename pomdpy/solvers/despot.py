@@ -0,0 +1,316 @@
+from __future__ import absolute_import
+from __future__ import division
+from builtins import range
+from builtins import object
+from past.utils import old_div
+import time
+import numpy as np
+from pomdpy.util import console
+from pomdpy.action_selection import ucb_action
+from .belief_tree_solver import BeliefTreeSolver
+
+module = "despot"
+
+
+class DespotNode(object):
+    """
+    Search statistics of a belief node of the DESPOT: the scenarios that reach the node, and the
+    lower and upper bounds on its value and on the values of its actions
+    """
+    def __init__(self, scenarios, depth, lower_bound, upper_bound):
+        # List of (scenario index, state) pairs
+        self.scenarios = scenarios
+        # Depth below the root of the search
+        self.depth = depth
+        # Bounds given by the model, before the node is expanded
+        self.default_lower_bound = lower_bound
+        self.default_upper_bound = upper_bound
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+        # Mean immediate reward and bounds of each action, indexed by bin number. None until expanded
+        self.rewards = None
+        self.action_lower_bounds = None
+        self.action_upper_bounds = None
+
+    @property
+    def is_expanded(self):
+        return self.rewards is not None
+
+    def gap(self):
+        return self.upper_bound - self.lower_bound
+
+
+class DESPOT(BeliefTreeSolver):
+    """
+    Determinized Sparse Partially Observable Tree, from "DESPOT: Online POMDP Planning with
+    Regularization" (Somani et al.)
+
+    At each step, n_scenarios states are sampled from the belief of the root, and each is given a fixed
+    stream of random numbers, so that the generative model is deterministic along every scenario. The
+    search only grows the part of the belief tree that the scenarios reach. Every belief node keeps a
+    lower and an upper bound on its value, and trials descend from the root along the action with the
+    highest upper bound and the observation with the highest weighted excess uncertainty, until the
+    gap between the bounds of the root is closed, n_sims trials were run or the search times out.
+    The action with the highest lower bound is taken.
+
+    Models provide the bounds through Model.value_lower_bound and Model.value_upper_bound
+    """
+
+    # Offset between the random streams of two consecutive depths of a scenario
+    DEPTH_SEED_STRIDE = 1000003
+
+    def __init__(self, agent):
+        """
+        Initialize an instance of the DESPOT solver
+        :param agent:
+        :return:
+        """
+        if agent.model.tree_backend == 'array':
+            raise ValueError('DESPOT is not supported by the array belief tree')
+        if agent.model.transpositions:
+            raise ValueError('DESPOT does not support transpositions')
+        if agent.model.n_workers > 1:
+            raise ValueError('DESPOT does not support parallel search')
+
+        super(DESPOT, self).__init__(agent)
+
+        # DespotNode of each belief node reached by the scenarios of the current search
+        self.nodes = {}
+        # Seed of the random stream of each scenario of the current search
+        self.scenario_seeds = None
+
+    @staticmethod
+    def reset(agent):
+        """
+        Generate a new DESPOT solver
+
+        :param agent:
+        Implementation of abstract method
+        """
+        return DESPOT(agent)
+
+    def select_eps_greedy_action(self, eps, start_time):
+        """
+        Builds a DESPOT from the belief node pointed to by the belief tree index, and returns the
+        action with the highest lower bound. If the belief tree data structure is disabled, random
+        rollout is used
+        """
+        if self.disable_tree:
+            self.rollout_search(self.belief_tree_index)
+        else:
+            self.build_despot(eps, start_time)
+        return ucb_action(self, self.belief_tree_index, True)
+
+    def build_despot(self, eps, start_time):
+        """
+        Sample the scenarios and run trials of the anytime heuristic search from the root
+
+        The random streams of the scenarios are drawn from the global numpy RNG, whose state is saved
+        and restored around the search, so that the search does not disturb the rest of the experiment
+        :param eps:
+        :param start_time:
+        :return:
+        """
+        root = self.belief_tree_index
+        self.nodes = {}
+        self.scenario_seeds = np.random.randint(0, 2 ** 31 - 1, size=self.model.n_scenarios)
+        scenarios = [(k, root.sample_particle()) for k in range(self.model.n_scenarios)]
+
+        rng_state = np.random.get_state()
+        try:
+            self.nodes[root] = self.create_despot_node(scenarios, 0)
+            n_trials = 0
+            while n_trials < self.model.n_sims and self.nodes[root].gap() > 0 and \
+                    time.time() - start_time < self.model.action_selection_timeout:
+                self.simulate(root, eps, start_time)
+                n_trials += 1
+        finally:
+            np.random.set_state(rng_state)
+
+        despot_root = self.nodes[root]
+        console(3, module, str(n_trials) + ' trials, root bounds = [' + str(despot_root.lower_bound) + ', ' +
+                str(despot_root.upper_bound) + ']')
+
+    def simulate(self, belief_node, eps, start_time):
+        """
+        One trial of the search: expand the nodes along the path of highest upper bound and excess
+        uncertainty starting at belief_node, then back up their bounds
+        :param belief_node:
+        :param eps:
+        :param start_time:
+        :return:
+        """
+        root_gap = self.nodes[belief_node].gap()
+        path = []
+        while self.nodes[belief_node].depth < self.model.max_depth and \
+                self.excess_uncertainty(self.nodes[belief_node], root_gap) > 0:
+            despot_node = self.nodes[belief_node]
+            if not despot_node.is_expanded:
+                self.expand(belief_node)
+            path.append(belief_node)
+
+            bin_number = int(np.argmax(despot_node.action_upper_bounds))
+            children = self.get_children(belief_node, bin_number)
+            if children.__len__() == 0:
+                # Every scenario terminated
+                break
+            belief_node = max(children, key=lambda child: self.excess_uncertainty(self.nodes[child], root_gap))
+
+        for belief_node in reversed(path):
+            self.update_bounds(belief_node)
+
+    def excess_uncertainty(self, despot_node, root_gap):
+        """
+        Excess uncertainty of a node: its gap, discounted and weighted by the fraction of the scenarios
+        that reach it, in excess of a fraction despot_xi of the gap of the root
+        :param despot_node:
+        :param root_gap:
+        :return:
+        """
+        weight = old_div(despot_node.scenarios.__len__(), self.model.n_scenarios)
+        return weight * (self.model.discount ** despot_node.depth * despot_node.gap() -
+                         self.model.despot_xi * root_gap)
+
+    def step_seed(self, scenario, depth):
+        """
+        Seed of the random numbers drawn by the generative model at depth along a scenario
+        :param scenario: scenario index
+        :param depth:
+        :return:
+        """
+        return int((self.scenario_seeds[scenario] + depth * self.DEPTH_SEED_STRIDE) % (2 ** 32))
+
+    def generate_scenario_step(self, scenario, depth, state, action):
+        """
+        Step the generative model with the random stream of the scenario
+        :return: StepResult
+        """
+        np.random.seed(self.step_seed(scenario, depth))
+        step_result, is_legal = self.model.generate_step(state, action)
+        return step_result
+
+    def create_despot_node(self, scenarios, depth):
+        """
+        :param scenarios: list of (scenario index, state) pairs reaching the node
+        :param depth:
+        :return: DespotNode bounded by the mean of the bounds of the states of the scenarios
+        """
+        lower_bound = np.mean([self.state_lower_bound(k, depth, state) for k, state in scenarios])
+        upper_bound = np.mean([self.state_upper_bound(state) for k, state in scenarios])
+        return DespotNode(scenarios, depth, lower_bound, upper_bound)
+
+    def state_lower_bound(self, scenario, depth, state):
+        """
+        Model lower bound on the value of state, or the return of a random rollout of the scenario if
+        the model does not provide one
+        :param scenario:
+        :param depth:
+        :param state:
+        :return:
+        """
+        lower_bound = self.model.value_lower_bound(state)
+        if lower_bound is not None:
+            return lower_bound
+
+        discounted_reward_sum = 0.0
+        discount = 1.0
+        while depth < self.model.max_depth:
+            legal_actions = self.model.get_legal_actions(state)
+            np.random.seed(self.step_seed(scenario, depth))
+            action = legal_actions[np.random.randint(legal_actions.__len__())]
+            step_result, is_legal = self.model.generate_step(state, action)
+            discounted_reward_sum += step_result.reward * discount
+            if step_result.is_terminal:
+                break
+            discount *= self.model.discount
+            state = step_result.next_state
+            depth += 1
+        return discounted_reward_sum
+
+    def state_upper_bound(self, state):
+        upper_bound = self.model.value_upper_bound(state)
+        if upper_bound is None:
+            raise ValueError('DESPOT requires the model to provide value_upper_bound')
+        return upper_bound
+
+    def expand(self, belief_node):
+        """
+        Step every scenario of belief_node with every legal action, and create the children of the
+        node for the observations they produce
+        :param belief_node:
+        :return:
+        """
+        despot_node = self.nodes[belief_node]
+        mapping = belief_node.action_map
+        n_actions = mapping.legal_mask.__len__()
+        despot_node.rewards = np.zeros(n_actions)
+
+        for bin_number in np.flatnonzero(mapping.legal_mask):
+            action = mapping.pool.sample_an_action(int(bin_number))
+            # (observation, scenarios) pairs, as the scenarios of an action only produce a few observations
+            child_scenarios = []
+            for k, state in despot_node.scenarios:
+                step_result = self.generate_scenario_step(k, despot_node.depth, state, action)
+                despot_node.rewards[bin_number] += step_result.reward
+                if step_result.is_terminal:
+                    continue
+                for observation, scenarios in child_scenarios:
+                    if observation == step_result.observation:
+                        scenarios.append((k, step_result.next_state))
+                        break
+                else:
+                    child_scenarios.append((step_result.observation, [(k, step_result.next_state)]))
+
+            despot_node.rewards[bin_number] /= despot_node.scenarios.__len__()
+            for observation, scenarios in child_scenarios:
+                child_node, added = belief_node.create_or_get_child(action, observation)
+                self.nodes[child_node] = self.create_despot_node(scenarios, despot_node.depth + 1)
+
+        self.update_bounds(belief_node)
+
+    def get_children(self, belief_node, bin_number):
+        """
+        :return: the children of belief_node under the action that are reached by the scenarios
+        """
+        action_node = belief_node.action_map.get_entry(bin_number).child_node
+        if action_node is None:
+            return []
+        return [entry.child_node for entry in action_node.observation_map.get_child_entries()
+                if entry.child_node in self.nodes]
+
+    def update_bounds(self, belief_node):
+        """
+        Back up the bounds of the actions of an expanded node from the bounds of its children, weighted
+        by the fraction of the scenarios of the node that reach each of them. The lower bound of each
+        action is also written to its action mapping entry, for the final action selection
+        :param belief_node:
+        :return:
+        """
+        despot_node = self.nodes[belief_node]
+        mapping = belief_node.action_map
+        n_scenarios = despot_node.scenarios.__len__()
+        despot_node.action_lower_bounds = np.full(despot_node.rewards.__len__(), -np.inf)
+        despot_node.action_upper_bounds = np.full(despot_node.rewards.__len__(), -np.inf)
+
+        for bin_number in np.flatnonzero(mapping.legal_mask):
+            lower_bound = upper_bound = despot_node.rewards[bin_number]
+            for child_node in self.get_children(belief_node, bin_number):
+                child = self.nodes[child_node]
+                weight = self.model.discount * old_div(child.scenarios.__len__(), n_scenarios)
+                lower_bound += weight * child.lower_bound
+                upper_bound += weight * child.upper_bound
+            despot_node.action_lower_bounds[bin_number] = lower_bound
+            despot_node.action_upper_bounds[bin_number] = upper_bound
+            mapping.get_entry(bin_number).mean_q_value = lower_bound
+
+        despot_node.lower_bound = max(despot_node.default_lower_bound, despot_node.action_lower_bounds.max())
+        despot_node.upper_bound = min(despot_node.default_upper_bound, despot_node.action_upper_bounds.max())
+
+    def update(self, step_result, prune=True):
+        """
+        The scenarios may all have missed the observation that was received. Its belief node is then
+        created before the update, and filled with particles by it
+        """
+        if not self.disable_tree:
+            self.belief_tree_index.create_or_get_child(step_result.action, step_result.observation)
+        super(DESPOT, self).update(step_result, prune)
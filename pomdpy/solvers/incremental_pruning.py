@@ -0,0 +1,69 @@
+from __future__ import absolute_import
+from builtins import range
+from .value_iteration import ValueIteration
+from .alpha_vector import AlphaVectorSet
+import numpy as np
+
+
+class IncrementalPruning(ValueIteration):
+    """
+    Exact value iteration by incremental pruning, from "Incremental Pruning: A Simple, Fast, Exact
+    Method for Partially Observable Markov Decision Processes" (Cassandra, Littman and Zhang)
+
+    Instead of enumerating the |A| * |V|^|Z| cross-products of the projected vectors before pruning,
+    the projected vector sets of the observations of an action are cross-summed one observation at a
+    time, and each partial cross-sum is pruned before the next observation is added to it.
+
+    The backup is the standard one,
+    alpha^{u,z}(x_i) = r[u][i] / |Z| + discount * sum_j t[u][i][j] * o[u][j][z] * alpha(x_j)
+    alpha^u = (+)_z alpha^{u,z}
+    """
+    @staticmethod
+    def reset(agent):
+        return IncrementalPruning(agent)
+
+    def value_iteration(self, t, o, r, horizon):
+        """
+        Solve the POMDP by computing all alpha vectors
+        :param t: transition probability matrix
+        :param o: observation probability matrix
+        :param r: immediate rewards matrix
+        :param horizon: integer valued scalar represented the number of planning steps
+        :return:
+        """
+        discount = self.model.discount
+        t = np.asarray(t, dtype=float)
+        o = np.asarray(o, dtype=float)
+        r = np.asarray(r, dtype=float)
+        actions, states, observations = o.shape
+
+        # start with a 0 alpha-vector
+        vectors = np.zeros((1, states))
+        vector_actions = np.array([-1])
+
+        for k in range(horizon):
+            print('[Incremental Pruning] planning horizon {}...'.format(k))
+            action_vectors = []
+            for u in range(actions):
+                # projected[z][n] = alpha_n^{u,z}, for every observation z and alpha vector n
+                projected = r[u] / observations + discount * np.einsum('ij,jz,nj->zni', t[u], o[u], vectors)
+                cross_sum = self.prune_vectors(projected[0])
+                for z in range(1, observations):
+                    cross_sum = (cross_sum[:, None, :] + self.prune_vectors(projected[z])[None, :, :]).reshape(
+                        -1, states)
+                    cross_sum = self.prune_vectors(cross_sum)
+                action_vectors.append(cross_sum)
+
+            vector_actions = np.concatenate([np.full(v.__len__(), u) for u, v in enumerate(action_vectors)])
+            vectors = np.concatenate(action_vectors)
+            kept = self.filter_vectors(vectors)
+            vectors, vector_actions = vectors[kept], vector_actions[kept]
+
+        self.gamma = AlphaVectorSet(states, vectors, vector_actions)
+
+    def prune_vectors(self, vectors):
+        """
+        :param vectors: (n_vectors, n_states) array
+        :return: the vectors of the array that are not dominated
+        """
+        return vectors[self.filter_vectors(vectors)]
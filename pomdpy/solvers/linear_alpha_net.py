@@ -4,7 +4,7 @@ import numpy as np
 import tensorflow as tf
 from experiments.scripts.pickle_wrapper import save_pkl, load_pkl
 from .ops import simple_linear, select_action_tf, clipped_error
-from .alpha_vector import AlphaVector
+from .alpha_vector import AlphaVector, AlphaVectorSet
 from .base_tf_solver import BaseTFSolver
 
 
@@ -135,10 +135,7 @@ class LinearAlphaNet(BaseTFSolver):
         })
 
         gamma = np.reshape(gamma, [self.model.num_actions, self.model.num_states])
-        vector_set = set()
-        for i in range(self.model.num_actions):
-            vector_set.add(AlphaVector(a=i, v=gamma[i]))
-        return vector_set
+        return AlphaVectorSet(self.model.num_states, gamma, np.arange(self.model.num_actions))
 
     def build_linear_network(self):
         with tf.variable_scope('linear_fa_prediction'):
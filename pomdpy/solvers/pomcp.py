@@ -3,20 +3,65 @@ from __future__ import division
 from builtins import range
 from past.utils import old_div
 import time
+import threading
 import numpy as np
-from pomdpy.util import console
-from pomdpy.action_selection import ucb_action
+from pomdpy.util import console, lock_for
+from pomdpy.action_selection import ucb_action, ucb_bin
+from pomdpy.discrete_pomdp import ArrayBeliefTree
 from .belief_tree_solver import BeliefTreeSolver
 
 module = "pomcp"
 
+# Fast-UCB tables shared by every POMCP instance of this process (and inherited by forked workers).
+# The UCB bonus c * sqrt(log(N + 1) / n) is separable, so it is stored as two 1-D tables,
+# sqrt(log(N + 1)) indexed by total visit count and 1 / sqrt(n) indexed by entry visit count, whose
+# product is scaled by the UCB coefficient. A table is never written after it is published; growing
+# it publishes a new, larger table
+_fast_ucb_tables = {}
+_fast_ucb_lock = threading.Lock()
+
+
+def _fast_ucb_table(name, initial_size, visit_count, build):
+    table = _fast_ucb_tables.get(name)
+    if table is not None and visit_count < table.__len__():
+        return table
+
+    with _fast_ucb_lock:
+        table = _fast_ucb_tables.get(name)
+        size = initial_size if table is None else table.__len__()
+        if table is not None and visit_count < size:
+            return table
+
+        # Grow by doubling, so that a long search only rebuilds the table a few times
+        while visit_count >= size:
+            size *= 2
+        with np.errstate(divide='ignore'):
+            table = build(np.arange(size, dtype=float))
+        table.flags.writeable = False
+        _fast_ucb_tables[name] = table
+        return table
+
+
+def fast_ucb_tables(total_visit_count, action_map_entry_visit_count):
+    """
+    Return the fast-UCB tables, building or growing them so that they cover the requested visit counts
+    :param total_visit_count: largest total visit count to be looked up
+    :param action_map_entry_visit_count: largest entry visit count to be looked up
+    :return: read-only arrays sqrt_log_n[N] = sqrt(log(N + 1)) and inv_sqrt_n[n] = 1 / sqrt(n), inf for n = 0
+    """
+    sqrt_log_n = _fast_ucb_table('sqrt_log_n', POMCP.UCB_N, total_visit_count,
+                                 lambda n: np.sqrt(np.log(n + 1.)))
+    inv_sqrt_n = _fast_ucb_table('inv_sqrt_n', POMCP.UCB_n, action_map_entry_visit_count,
+                                 lambda n: 1. / np.sqrt(n))
+    return sqrt_log_n, inv_sqrt_n
+
 
 class POMCP(BeliefTreeSolver):
     """
     Monte-Carlo Tree Search implementation, from POMCP
     """
 
-    # Dimensions for the fast-UCB table
+    # Initial sizes of the fast-UCB tables
     UCB_N = 10000
     UCB_n = 100
 
@@ -29,15 +74,11 @@ class POMCP(BeliefTreeSolver):
         """
         super(POMCP, self).__init__(agent)
 
-        # Pre-calculate UCB values for a speed-up
-        self.fast_UCB = [[None for _ in range(POMCP.UCB_n)] for _ in range(POMCP.UCB_N)]
+        # Pre-calculated UCB factors for a speed-up, shared with the other solver instances
+        self.fast_UCB = fast_ucb_tables(0, 0)
 
-        for N in range(POMCP.UCB_N):
-            for n in range(POMCP.UCB_n):
-                if n is 0:
-                    self.fast_UCB[N][n] = np.inf
-                else:
-                    self.fast_UCB[N][n] = agent.model.ucb_coefficient * np.sqrt(old_div(np.log(N + 1), n))
+        # Per-thread buffers recording the path of a simulation, see traverse
+        self.paths = threading.local()
 
     @staticmethod
     def reset(agent):
@@ -57,14 +98,26 @@ class POMCP(BeliefTreeSolver):
         :param log_n:
         :return:
         """
-        assert self.fast_UCB is not None
-        if total_visit_count < POMCP.UCB_N and action_map_entry_visit_count < POMCP.UCB_n:
-            return self.fast_UCB[int(total_visit_count)][int(action_map_entry_visit_count)]
-
         if action_map_entry_visit_count == 0:
             return np.inf
-        else:
-            return self.model.ucb_coefficient * np.sqrt(old_div(log_n, action_map_entry_visit_count))
+        sqrt_log_n, inv_sqrt_n = fast_ucb_tables(total_visit_count, action_map_entry_visit_count)
+        return self.model.ucb_coefficient * sqrt_log_n[int(total_visit_count)] * \
+            inv_sqrt_n[int(action_map_entry_visit_count)]
+
+    def find_fast_ucb_vector(self, total_visit_count, action_map_entry_visit_counts):
+        """
+        Vectorized find_fast_ucb over the visit counts of all of the entries of an action mapping
+        :param total_visit_count:
+        :param action_map_entry_visit_counts: array of visit counts, indexed by bin number
+        :return: array of UCB exploration bonuses, inf for unvisited entries
+        """
+        visit_counts = np.asarray(action_map_entry_visit_counts)
+        sqrt_log_n, inv_sqrt_n = fast_ucb_tables(total_visit_count, visit_counts.max())
+        scale = self.model.ucb_coefficient * sqrt_log_n[int(total_visit_count)]
+        if scale == 0:
+            # Avoid 0 * inf for the unvisited entries
+            return np.where(visit_counts == 0, np.inf, 0.)
+        return scale * inv_sqrt_n[visit_counts]
 
     def select_eps_greedy_action(self, eps, start_time):
         """
@@ -82,56 +135,201 @@ class POMCP(BeliefTreeSolver):
         :param belief_node:
         :return:
         """
+        if isinstance(self.belief_tree, ArrayBeliefTree):
+            return self.traverse_array(belief_node.id, 0, start_time)
         return self.traverse(belief_node, 0, start_time)
 
     def traverse(self, belief_node, tree_depth, start_time):
+        """
+        Run one simulation from the belief node. The tree is descended iteratively, recording the
+        (belief node, action mapping entry, reward) path, and the Q values are backed up in a single
+        reverse pass over the path
+        :param belief_node:
+        :param tree_depth:
+        :param start_time:
+        :return: the backed up Q value of the first step of the simulation
+        """
+        path_nodes, path_entries, path_rewards = self.path_buffers()
+        path_length = 0
         delayed_reward = 0
+        # Actions taken from the current step of the simulation onwards, for the RAVE statistics
+        rave_actions = None
+        if self.model.rave_equivalence > 0:
+            rave_actions = np.zeros(self.model.get_all_actions().__len__(), dtype=bool)
+
+        while True:
+            state = belief_node.sample_particle()
+
+            # Time expired
+            if time.time() - start_time > self.model.action_selection_timeout:
+                console(4, module, "action selection timeout")
+                break
 
-        state = belief_node.sample_particle()
+            action = ucb_action(self, belief_node, False)
 
-        # Time expired
-        if time.time() - start_time > self.model.action_selection_timeout:
-            console(4, module, "action selection timeout")
-            return 0
+            # Search horizon reached
+            if tree_depth >= self.model.max_depth:
+                console(4, module, "Search horizon reached")
+                break
 
-        action = ucb_action(self, belief_node, False)
+            action_mapping_entry = belief_node.action_map.get_entry(action.bin_number)
+            # Only expand nodes that have been visited before, not counting this simulation's virtual loss
+            visited = belief_node.action_map.total_visit_count > 0
 
-        # Search horizon reached
-        if tree_depth >= self.model.max_depth:
-            console(4, module, "Search horizon reached")
-            return 0
+            if self.virtual_loss:
+                with lock_for(belief_node.action_map):
+                    action_mapping_entry.add_virtual_loss(self.virtual_loss)
 
-        step_result, is_legal = self.model.generate_step(state, action)
+            step_result, is_legal = self.model.generate_step(state, action)
 
-        child_belief_node = belief_node.child(action, step_result.observation)
-        if child_belief_node is None and not step_result.is_terminal and belief_node.action_map.total_visit_count > 0:
-            child_belief_node, added = belief_node.create_or_get_child(action, step_result.observation)
+            path_nodes[path_length] = belief_node
+            path_entries[path_length] = action_mapping_entry
+            path_rewards[path_length] = step_result.reward
+            path_length += 1
 
-        if not step_result.is_terminal or not is_legal:
-            tree_depth += 1
-            if child_belief_node is not None:
-                # Add S' to the new belief node
-                # Add a state particle with the new state
-                if child_belief_node.state_particles.__len__() < self.model.max_particle_count:
-                    child_belief_node.state_particles.append(step_result.next_state)
-                delayed_reward = self.traverse(child_belief_node, tree_depth, start_time)
+            child_belief_node = belief_node.child(action, step_result.observation)
+            if child_belief_node is None and not step_result.is_terminal and visited:
+                child_belief_node = self.widen_observation(action_mapping_entry, step_result.observation)
+                if child_belief_node is None:
+                    child_belief_node, added = belief_node.create_or_get_child(action, step_result.observation)
+
+            if not step_result.is_terminal or not is_legal:
+                tree_depth += 1
+                if child_belief_node is not None:
+                    # Add S' to the new belief node
+                    # Add a state particle with the new state
+                    with lock_for(child_belief_node):
+                        if child_belief_node.state_particles.__len__() < \
+                                self.particle_budget(child_belief_node.state_particles):
+                            child_belief_node.state_particles.append(step_result.next_state)
+                    belief_node = child_belief_node
+                    continue
+                delayed_reward = self.rollout(belief_node, rave_actions)
             else:
-                delayed_reward = self.rollout(belief_node)
-            tree_depth -= 1
-        else:
-            console(4, module, "Reached terminal state.")
+                console(4, module, "Reached terminal state.")
+            break
 
         # delayed_reward is "Q maximal"
-        # current_q_value is the Q value of the current belief-action pair
-        action_mapping_entry = belief_node.action_map.get_entry(action.bin_number)
+        # The backed up Q value of each belief-action pair is the delayed reward of its parent
+        for i in range(path_length - 1, -1, -1):
+            action_mapping_entry = path_entries[i]
+            if rave_actions is not None:
+                rave_actions[action_mapping_entry.bin_number] = True
+            # Always locked, since the search may be tree-parallel without a virtual loss
+            with lock_for(path_nodes[i].action_map):
+                if self.virtual_loss:
+                    action_mapping_entry.remove_virtual_loss(self.virtual_loss)
+                delayed_reward = self.backup(action_mapping_entry, path_rewards[i], delayed_reward)
+                if rave_actions is not None:
+                    path_nodes[i].action_map.update_rave(rave_actions, delayed_reward)
+            # Don't keep the path alive past this simulation
+            path_nodes[i] = path_entries[i] = None
 
+        return delayed_reward
+
+    def traverse_array(self, node_id, tree_depth, start_time):
+        """
+        traverse for an ArrayBeliefTree. The path is recorded as (node id, bin number, reward), and the
+        statistics arrays of the tree are read and backed up by node id, without going through the action
+        mappings of the nodes. The array tree does not support tree-parallel search, so nothing is locked
+        :param node_id:
+        :param tree_depth:
+        :param start_time:
+        :return: the backed up Q value of the first step of the simulation
+        """
+        tree = self.belief_tree
+        action_pool = tree.agent.action_pool
+        path_nodes, path_bins, path_rewards = self.path_buffers()
+        path_length = 0
+        delayed_reward = 0
+        rave_actions = None
+        if self.model.rave_equivalence > 0:
+            rave_actions = np.zeros(self.model.get_all_actions().__len__(), dtype=bool)
+
+        while True:
+            belief_node = tree.nodes[node_id]
+            state = belief_node.sample_particle()
+
+            # Time expired
+            if time.time() - start_time > self.model.action_selection_timeout:
+                console(4, module, "action selection timeout")
+                break
+
+            bin_number = ucb_bin(self, tree, node_id, False)
+
+            # Search horizon reached
+            if tree_depth >= self.model.max_depth:
+                console(4, module, "Search horizon reached")
+                break
+
+            # Only expand nodes that have been visited before
+            visited = tree.node_visit_count[node_id] > 0
+            action = action_pool.sample_an_action(bin_number)
+            step_result, is_legal = self.model.generate_step(state, action)
+
+            path_nodes[path_length] = node_id
+            path_bins[path_length] = bin_number
+            path_rewards[path_length] = step_result.reward
+            path_length += 1
+
+            child_id = tree.child_id(node_id, bin_number, step_result.observation)
+            if child_id < 0 and not step_result.is_terminal and visited:
+                child_node = self.widen_observation(belief_node.action_map.get_entry(bin_number),
+                                                    step_result.observation)
+                if child_node is None:
+                    child_node, added = belief_node.create_or_get_child(action, step_result.observation)
+                child_id = child_node.id
+
+            if not step_result.is_terminal or not is_legal:
+                tree_depth += 1
+                if child_id >= 0:
+                    # Add a state particle with the new state
+                    child_particles = tree.nodes[child_id].state_particles
+                    if child_particles.__len__() < self.particle_budget(child_particles):
+                        child_particles.append(step_result.next_state)
+                    node_id = child_id
+                    continue
+                delayed_reward = self.rollout(belief_node, rave_actions)
+            else:
+                console(4, module, "Reached terminal state.")
+            break
+
+        for i in range(path_length - 1, -1, -1):
+            if rave_actions is not None:
+                rave_actions[path_bins[i]] = True
+            # The off-policy Q-learning update of backup
+            delayed_reward = path_rewards[i] + self.model.discount * delayed_reward
+            tree.backup(path_nodes[i], path_bins[i], delayed_reward)
+            if rave_actions is not None:
+                tree.update_rave(path_nodes[i], rave_actions, delayed_reward)
+
+        return delayed_reward
+
+    def path_buffers(self):
+        """
+        Return the path buffers of the calling thread, allocated once per thread and sized to
+        the search horizon
+        :return: belief node, action mapping entry and reward buffers
+        """
+        buffers = getattr(self.paths, 'buffers', None)
+        if buffers is None or buffers[0].__len__() < self.model.max_depth:
+            buffers = ([None] * self.model.max_depth, [None] * self.model.max_depth, [0] * self.model.max_depth)
+            self.paths.buffers = buffers
+        return buffers
+
+    def backup(self, action_mapping_entry, reward, delayed_reward):
+        """
+        Apply the off-policy Q-learning update to the statistics of a belief-action pair
+        :param action_mapping_entry:
+        :param reward:
+        :param delayed_reward:
+        :return: the backed up Q value
+        """
         q_value = action_mapping_entry.mean_q_value
 
         # off-policy Q learning update rule
-        q_value += (step_result.reward + (self.model.discount * delayed_reward) - q_value)
+        q_value += (reward + (self.model.discount * delayed_reward) - q_value)
 
         action_mapping_entry.update_visit_count(1)
         action_mapping_entry.update_q_value(q_value)
-
-        # Add RAVE ?
         return q_value
@@ -1,6 +1,6 @@
 from __future__ import absolute_import
 from .solver import Solver
-from .alpha_vector import AlphaVector
+from .alpha_vector import AlphaVectorSet
 from scipy.optimize import linprog
 import numpy as np
 from itertools import product
@@ -14,7 +14,7 @@ class ValueIteration(Solver):
         :return:
         """
         super(ValueIteration, self).__init__(agent)
-        self.gamma = set()
+        self.gamma = AlphaVectorSet(self.model.num_states)
         self.history = agent.histories.create_sequence()
 
     @staticmethod
@@ -35,40 +35,30 @@ class ValueIteration(Solver):
         states = self.model.num_states  # |S| states
         observations = len(self.model.get_all_observations())  # |Z| observations
         first = True
+        self.gamma = self.gamma.copy()
 
         # initialize gamma with a 0 alpha-vector
-        dummy = AlphaVector(a=-1, v=np.zeros(states))
-        self.gamma.add(dummy)
+        dummy = len(self.gamma)
+        self.gamma.append(-1, np.zeros(states))
 
         # start with 1 step planning horizon, up to horizon-length planning horizon
         for k in range(horizon):
             print('[Value Iteration] planning horizon {}...'.format(k))
-            # new set of alpha vectors to add to set gamma
-            gamma_k = set()
-            # Compute the new coefficients for the new alpha-vectors
-            v_new = np.zeros(shape=(len(self.gamma), actions, observations, states))
-            idx = 0
-            for v in self.gamma:
-                for u in range(actions):
-                    for z in range(observations):
-                        for j in range(states):
-                            for i in range(states):
-                                # v_i_k * p(z | x_i, u) * p(x_i | u, x_j)
-                                v_new[idx][u][z][i] += v.v[i] * o[u][i][z] * t[u][j][i]
-                idx += 1
+            n_vectors = len(self.gamma)
+            # Compute the new coefficients for the new alpha-vectors in a single contraction,
+            # v_new[idx][u][z][i] = sum_j v_i_k * p(z | x_i, u) * p(x_i | u, x_j)
+            v_new = np.einsum('ni,uiz,uji->nuzi', self.gamma.vectors, o, t)
             # add (|A| * |V|^|Z|) alpha-vectors to gamma, |V| is |gamma_k|
-            for u in range(actions):
-                c = self.compute_indices(idx, observations)
-                for indices in c:  # n elements in c is |V|^|Z|
-                    for z in range(observations):
-                        temp = np.zeros(states)
-                        for i in range(states):
-                            temp[i] = discount * (r[u][i] + v_new[indices[z]][u][z][i])
-                        gamma_k.add(AlphaVector(a=u, v=temp))
-            self.gamma.update(gamma_k)
+            c = np.array(self.compute_indices(n_vectors, observations))  # n rows in c is |V|^|Z|
+            # projected[n][z][u] = v_new[c[n][z]][u][z], for every row n of c and every observation z
+            projected = v_new[c, :, np.arange(observations), :]
+            new_vectors = discount * (np.asarray(r)[None, None, :, :] + projected)
+            # gamma_k[u] holds the new alpha-vectors of action u
+            gamma_k = np.transpose(new_vectors, (2, 0, 1, 3)).reshape(actions, -1, states)
+            self.gamma.extend(np.repeat(np.arange(actions), gamma_k.shape[1]), gamma_k)
             if first:
                 # remove the dummy alpha vector
-                self.gamma.remove(dummy)
+                self.gamma = self.gamma.subset(np.arange(len(self.gamma)) != dummy)
                 first = False
             self.prune(states)
             #  plot_gamma(title='V(b) for horizon T = ' + str(k + 1), self.gamma)
@@ -91,91 +81,132 @@ class ValueIteration(Solver):
         :param n_states
         :return:
         """
+        self.gamma = self.gamma.subset(self.filter_vectors(self.gamma.vectors))
+
+    @staticmethod
+    def pointwise_dominated(vectors, delta=0.0000000001):
+        """
+        Vectorized pointwise-dominance and duplicate filter. A vector is dominated if another vector is at
+        least as large, to within delta, in every state. Of vectors that dominate each other (duplicates to
+        within delta), only the first is kept
+        :param vectors: (n_vectors, n_states) array
+        :param delta:
+        :return: boolean mask of the dominated vectors
+        """
+        n_vectors = vectors.__len__()
+        dominated = np.zeros(n_vectors, dtype=bool)
+        # compare blocks of rows against all of the vectors, to bound the size of the comparison array
+        block = max(1, 10000000 // max(1, n_vectors * vectors.shape[1]))
+        for start in range(0, n_vectors, block):
+            rows = vectors[start:start + block]
+            # at_least[i][j]: vector j is at least as large as row i in every state
+            at_least = np.all(vectors[None, :, :] >= rows[:, None, :] - delta, axis=-1)
+            # at_most[i][j]: row i is at least as large as vector j in every state
+            at_most = np.all(rows[:, None, :] >= vectors[None, :, :] - delta, axis=-1)
+            index = np.arange(start, start + rows.__len__())[:, None]
+            others = np.arange(n_vectors)[None, :]
+            dominated[start:start + block] = np.any(at_least & (~at_most | (others < index)) & (others != index),
+                                                    axis=1)
+        return dominated
+
+    @staticmethod
+    def filter_vectors(vectors):
+        """
+        Lark's filtering algorithm, for any number of states. Pointwise-dominated vectors and duplicates are
+        removed first. A remaining candidate is only kept if a single linear program finds a belief at which it
+        is strictly better than every vector kept so far; the best candidate at that belief is then kept
+        :param vectors: (n_vectors, n_states) array
+        :return: sorted array of the indices of the vectors that are not dominated
+        """
         # parameters for linear program
         delta = 0.0000000001
-        # equality constraints on the belief states
-        A_eq = np.array([np.append(np.ones(n_states), [0.])])
-        b_eq = np.array([1.])
+        n_states = vectors.shape[1]
+
+        if n_states == 2:
+            # the belief simplex is a segment, no LP needed
+            return ValueIteration.upper_envelope(vectors)
 
         # dirty set
-        F = self.gamma.copy()
+        candidates = list(np.flatnonzero(~ValueIteration.pointwise_dominated(vectors, delta)))
         # clean set
-        Q = set()
+        kept = []
 
+        # the best vectors at the corners of the belief simplex are never dominated
         for i in range(n_states):
-            max_i = -np.inf
-            best = None
-            for av in F:
-                if av.v[i] > max_i:
-                    max_i = av.v[i]
-                    best = av
-            Q.update({best})
-            F.remove(best)
-        while F:
-            av_i = F.pop()  # get a reference to av_i
-            F.add(av_i)  # don't want to remove it yet from F
-            dominated = False
-            for av_j in Q:
-                c = np.append(np.zeros(n_states), [1.])
-                A_ub = np.array([np.append(-(av_i.v - av_j.v), [-1.])])
-                b_ub = np.array([-delta])
-
-                res = linprog(c, A_eq=A_eq, b_eq=b_eq, A_ub=A_ub, b_ub=b_ub, bounds=(0, None))
-                if res.x[n_states] > 0.0:
-                    # this one is dominated
-                    dominated = True
-                    F.remove(av_i)
-                    break
+            best = candidates[int(np.argmax(vectors[candidates, i]))]
+            if best not in kept:
+                kept.append(best)
+        candidates = [n for n in candidates if n not in kept]
 
-            if not dominated:
-                max_k = -np.inf
-                best = None
-                for av_k in F:
-                    b = res.x[0:2]
-                    v = np.dot(av_k.v, b)
-                    if v > max_k:
-                        max_k = v
-                        best = av_k
-                F.remove(best)
-                if not self.check_duplicate(Q, best):
-                    Q.update({best})
-        self.gamma = Q
+        # maximize d subject to b . (alpha - alpha_q) >= d for every kept alpha_q, sum(b) = 1, b >= 0
+        c = np.append(np.zeros(n_states), [-1.])
+        A_eq = np.array([np.append(np.ones(n_states), [0.])])
+        b_eq = np.array([1.])
+        bounds = [(0, None)] * n_states + [(None, None)]
+
+        while candidates:
+            alpha = vectors[candidates[-1]]
+            A_ub = np.hstack([vectors[kept] - alpha, np.ones((kept.__len__(), 1))])
+            b_ub = np.zeros(kept.__len__())
+            res = linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=bounds)
+            if res.status != 0 or -res.fun <= delta:
+                # this one is dominated
+                candidates.pop()
+                continue
+
+            # keep the best candidate at the witness belief
+            values = np.dot(vectors[candidates], res.x[:n_states])
+            best = candidates.pop(int(np.argmax(values)))
+            kept.append(best)
+
+        return np.sort(kept)
 
     @staticmethod
-    def check_duplicate(a, av):
+    def upper_envelope(vectors):
         """
-        Check whether alpha vector av is already in set a
-
-        :param a:
-        :param av:
-        :return:
+        Exact pruning for 2-state models, in O(n log n). With b = (p, 1 - p), the value of each alpha vector
+        is the line v[1] + p * (v[0] - v[1]) over p in [0, 1], so the vectors that are not dominated are the
+        lines of the upper envelope over that segment. The envelope is built with a convex-hull sweep over
+        the lines sorted by slope
+        :param vectors: (n_vectors, 2) array
+        :return: sorted array of the indices of the vectors that are not dominated
         """
-        for av_i in a:
-            if np.allclose(av_i.v, av.v):
-                return True
-            if av_i.v[0] == av.v[0] and av_i.v[1] > av.v[1]:
-                return True
-            if av_i.v[1] == av.v[1] and av_i.v[0] > av.v[0]:
-                return True
+        slopes = vectors[:, 0] - vectors[:, 1]
+        intercepts = vectors[:, 1]
+        # by increasing slope, and of the lines with the same slope, the highest one first
+        order = np.lexsort((-intercepts, slopes))
+
+        # hull holds the lines of the envelope over all p, and starts[k] is the p at which line hull[k] starts
+        hull = []
+        starts = []
+        for n in order:
+            if hull and slopes[n] == slopes[hull[-1]]:
+                # parallel to, and not above, the last line of the hull
+                continue
+            while hull:
+                start = (intercepts[hull[-1]] - intercepts[n]) / (slopes[n] - slopes[hull[-1]])
+                if start > starts[-1]:
+                    break
+                # line n is above the last line of the hull wherever that one was on the envelope
+                hull.pop()
+                starts.pop()
+            starts.append(start if hull else -np.inf)
+            hull.append(n)
+
+        # keep the lines that are on the envelope for a part of [0, 1] of non-zero length
+        starts = np.array(starts)
+        ends = np.append(starts[1:], np.inf)
+        on_segment = np.minimum(ends, 1.) - np.maximum(starts, 0.) > 0
+        return np.sort(np.array(hull)[on_segment])
 
     @staticmethod
     def select_action(belief, vector_set):
         """
         Compute optimal action given a belief distribution
         :param belief: dim(belief) == dim(AlphaVector)
-        :param vector_set
+        :param vector_set: AlphaVectorSet, or set of AlphaVector
         :return:
         """
-        max_v = -np.inf
-        best = None
-        for av in vector_set:
-            v = np.dot(av.v, belief)
-
-            if v > max_v:
-                max_v = v
-                best = av
-
-        if best is None:
-            raise ValueError('Vector set should not be empty')
-
+        vector_set = AlphaVectorSet.from_alpha_vectors(vector_set, belief.__len__())
+        best = vector_set[vector_set.best_vectors(belief)[0]]
         return best.action, best
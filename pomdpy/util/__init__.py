@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 from . import config_parser
 from .console import print_divider, console, console_no_print, VERBOSITY
+from .locks import lock_for
 
-__all__ = ['config_parser', 'console']
+__all__ = ['config_parser', 'console', 'locks']
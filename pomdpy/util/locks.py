@@ -0,0 +1,14 @@
+"""
+Striped locks for tree-parallel search. Objects are hashed onto a fixed pool of locks, so that nodes of the
+belief tree can be guarded without storing a lock in every node
+"""
+import threading
+
+N_LOCKS = 256
+
+_locks = [threading.Lock() for _ in range(N_LOCKS)]
+
+
+def lock_for(obj):
+    # Object addresses are 16-byte aligned, so drop the low bits before striping
+    return _locks[(id(obj) >> 4) % N_LOCKS]
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from pomdpy.solvers.alpha_vector import AlphaVector, AlphaVectorSet
+
+
+def test_from_alpha_vectors():
+    vector_set = AlphaVectorSet.from_alpha_vectors([AlphaVector(0, np.array([1., 0.])),
+                                                    AlphaVector(1, np.array([0., 1.]))])
+    assert vector_set.__len__() == 2
+    assert list(vector_set.actions) == [0, 1]
+    best, values = vector_set.best_vectors(np.array([[0.8, 0.2], [0.3, 0.7]]))
+    assert list(best) == [0, 1]
+    assert np.allclose(values, [0.8, 0.7])
+
+
+def test_from_no_alpha_vectors():
+    assert AlphaVectorSet.from_alpha_vectors([], 3).__len__() == 0
+    with pytest.raises(ValueError):
+        AlphaVectorSet.from_alpha_vectors([])
+
+
+def test_append_grows_storage():
+    vector_set = AlphaVectorSet(2)
+    for k in range(10):
+        vector_set.append(k, [k, -k])
+    assert vector_set.__len__() == 10
+    assert np.array_equal(vector_set.vectors[:, 0], np.arange(10))
+    assert np.array_equal(vector_set.subset(vector_set.actions % 2 == 0).actions, [0, 2, 4, 6, 8])
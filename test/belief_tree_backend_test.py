@@ -0,0 +1,39 @@
+import random
+import time
+
+import numpy as np
+
+from pomdpy import Agent
+from pomdpy.solvers import POMCP
+from examples.rock_sample import RockModel
+from .rock_sample_args import rock_sample_args
+
+
+def root_statistics(tree_backend, n_steps=3):
+    np.random.seed(3)
+    random.seed(3)
+    model = RockModel(rock_sample_args(tree_backend=tree_backend, n_sims=300))
+    agent = Agent(model, POMCP)
+    model.reset_for_epoch()
+    solver = POMCP(agent)
+    statistics = []
+    for step in range(n_steps):
+        action = solver.select_eps_greedy_action(0, time.time())
+        action_map = solver.belief_tree_index.action_map
+        statistics.append((action.bin_number, list(action_map.visit_counts), list(action_map.mean_q_values)))
+        step_result, is_legal = model.generate_step(solver.belief_tree_index.sample_particle(), action)
+        solver.update(step_result)
+    return statistics
+
+
+def test_array_backend_matches_object_backend():
+    """
+    With the same seed, both belief tree backends run the same simulations and build the same root
+    """
+    expected = root_statistics('object')
+    actual = root_statistics('array')
+    assert actual.__len__() == expected.__len__()
+    for (expected_action, expected_visits, expected_q), (action, visits, q) in zip(expected, actual):
+        assert action == expected_action
+        assert visits == expected_visits
+        assert np.allclose(q, expected_q)
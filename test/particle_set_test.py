@@ -0,0 +1,53 @@
+import random
+import sys
+import threading
+
+from pomdpy.pomdp import ParticleSet
+
+
+def test_indexing_matches_list():
+    states = [random.randint(0, 9) for _ in range(200)]
+    particles = ParticleSet(states)
+    assert particles.__len__() == states.__len__()
+    assert sorted(particles[k] for k in range(particles.__len__())) == sorted(states)
+    assert sorted(particles) == sorted(states)
+    assert particles.distinct_count() == len(set(states))
+
+
+def test_concurrent_sample_and_append():
+    """
+    Tree-parallel workers sample the particles of a belief node while other workers append to it
+    """
+    particles = ParticleSet([0])
+    n_appends = 200000
+    errors = []
+
+    def append():
+        try:
+            for k in range(n_appends):
+                particles.append(k % 1000)
+        except Exception as e:
+            errors.append(e)
+
+    def sample():
+        try:
+            while particles.__len__() < n_appends + 1:
+                random.choice(particles)
+                # The particle appended last is the one a concurrent append is still adding
+                particles[particles.__len__() - 1]
+        except Exception as e:
+            errors.append(e)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        workers = [threading.Thread(target=append)] + [threading.Thread(target=sample) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert errors == []
+    assert particles.__len__() == n_appends + 1
@@ -0,0 +1,27 @@
+import numpy as np
+
+from examples.rock_sample import RockModel, RockState
+from .rock_sample_args import rock_sample_args
+
+
+def test_generate_step_batch_matches_generate_step():
+    np.random.seed(1)
+    model = RockModel(rock_sample_args())
+    model.reset_for_epoch()
+    model.unique_rocks_sampled = [0]
+    # Checks are noisy, and the scalar and batched models draw their noise differently. Sensors that are
+    # either always right or always wrong make both deterministic, and still exercise misread rocks
+    model.check_accuracy = np.random.randint(2, size=model.check_accuracy.shape).astype(float)
+
+    states = np.column_stack([np.random.randint(model.n_rows, size=500), np.random.randint(model.n_cols, size=500),
+                              np.random.randint(1 << model.n_rocks, size=500)])
+    for action in range(model.get_all_actions().__len__()):
+        batch = model.generate_step_batch(states, action)
+        for k, (i, j, rocks) in enumerate(states):
+            state = RockState.from_value(RockState.pack(i, j, rocks), model.n_rocks)
+            step_result, is_legal = model.generate_step(state, action)
+            assert batch.is_legal[k] == is_legal
+            assert list(batch.next_states[k]) == list(model.encode_states([step_result.next_state])[0])
+            assert batch.observations[k] == model.encode_observation(step_result.observation)
+            assert batch.rewards[k] == step_result.reward
+            assert batch.is_terminal[k] == step_result.is_terminal
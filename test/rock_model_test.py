@@ -0,0 +1,43 @@
+import numpy as np
+
+from examples.rock_sample import RockModel, RockAction, RockState, GridPosition
+from examples.rock_sample.rock_action import ActionType
+from pomdpy.util import config_parser
+from .rock_sample_args import rock_sample_args
+
+
+def rock_model(monkeypatch, map_text):
+    monkeypatch.setattr(config_parser, 'parse_map', lambda map_file: (map_text, [len(map_text), len(map_text[0])]))
+    return RockModel(rock_sample_args())
+
+
+def test_value_lower_bound_goes_around_obstacles(monkeypatch):
+    model = rock_model(monkeypatch, ['S.X.G',
+                                     '..X.G',
+                                     'o...G'])
+    model.reset_for_epoch()
+    state = RockState(GridPosition(0, 0), [False])
+
+    # The shortest path to the exit goes south around the wall, 6 moves instead of 4
+    assert model.goal_distances[0, 0] == 6
+    discounted_return = 0.
+    discount = 1.
+    for action_type in [ActionType.SOUTH, ActionType.SOUTH] + [ActionType.EAST] * 4:
+        step_result, is_legal = model.generate_step(state, RockAction(action_type))
+        assert is_legal
+        discounted_return += discount * step_result.reward
+        discount *= model.discount
+        state = step_result.next_state
+    assert step_result.is_terminal
+    assert np.isclose(model.value_lower_bound(RockState(GridPosition(0, 0), [False])), discounted_return)
+
+
+def test_value_bounds_are_ordered(monkeypatch):
+    model = rock_model(monkeypatch, ['S.X.G',
+                                     '..X.G',
+                                     'o...G'])
+    model.reset_for_epoch()
+    for i in range(model.n_rows):
+        for j in range(model.n_cols):
+            state = RockState(GridPosition(i, j), [False])
+            assert model.value_lower_bound(state) <= model.value_upper_bound(state)
@@ -0,0 +1,17 @@
+def rock_sample_args(**kwargs):
+    """
+    The arguments pomcp.py passes to RockModel, with small search and particle budgets
+    :param kwargs: overridden arguments
+    :return: dict
+    """
+    args = dict(env='RockSample', solver='POMCP', seed=1, use_tf=False, discount=0.95, n_epochs=1, max_steps=30,
+                save=False, test=10, epsilon_start=0.5, epsilon_minimum=0.1, epsilon_decay=0.95,
+                epsilon_decay_step=20, n_sims=100, timeout=3600, preferred_actions=False, ucb_coefficient=3.0,
+                n_start_states=200, min_particle_count=100, max_particle_count=200, transpositions=False,
+                observation_widening=0., observation_widening_exponent=0.5, action_widening=0.,
+                action_widening_exponent=0.5, rave_equivalence=0., kld_sampling=False, kld_epsilon=0.05,
+                kld_delta=0.01, n_scenarios=50, despot_xi=0.95, max_depth=100, action_selection_timeout=60,
+                tree_backend='object', approximate_belief=False, max_refill_attempts=100000, refill_timeout=10.0,
+                particle_filter=False, rollout_particles=1, n_workers=1, parallel='root', virtual_loss=10.0)
+    args.update(kwargs)
+    return args
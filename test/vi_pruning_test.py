@@ -0,0 +1,58 @@
+import itertools
+
+import numpy as np
+
+from pomdpy.solvers import ValueIteration
+
+
+def envelope_brute_force(vectors):
+    """
+    Exact 2-state upper envelope: between two consecutive crossing points of the lines, a single vector is the
+    best, so the vectors of the envelope are the best vectors at the midpoints of the crossing points
+    """
+    slopes = vectors[:, 0] - vectors[:, 1]
+    intercepts = vectors[:, 1]
+    points = [0., 1.]
+    for m, n in itertools.combinations(range(vectors.__len__()), 2):
+        if slopes[m] != slopes[n]:
+            p = (intercepts[n] - intercepts[m]) / (slopes[m] - slopes[n])
+            if 0 < p < 1:
+                points.append(p)
+    points = np.unique(points)
+    midpoints = (points[1:] + points[:-1]) / 2
+    beliefs = np.stack([midpoints, 1 - midpoints], axis=1)
+    return np.unique(np.argmax(np.dot(beliefs, vectors.T), axis=1))
+
+
+def simplex_grid(n_states, resolution):
+    points = [p for p in itertools.product(range(resolution + 1), repeat=n_states - 1) if sum(p) <= resolution]
+    points = np.array(points, dtype=float) / resolution
+    return np.hstack([points, 1 - points.sum(axis=1, keepdims=True)])
+
+
+def test_upper_envelope_matches_brute_force():
+    rng = np.random.RandomState(0)
+    for trial in range(50):
+        vectors = rng.uniform(-10, 10, size=(rng.randint(1, 30), 2))
+        assert np.array_equal(ValueIteration.upper_envelope(vectors), envelope_brute_force(vectors))
+
+
+def test_upper_envelope_drops_duplicates_and_dominated_vectors():
+    vectors = np.array([[0., 0.], [1., 1.], [1., 1.], [2., -5.], [-5., 2.], [0.5, 0.5]])
+    assert list(ValueIteration.upper_envelope(vectors)) == [1, 3, 4]
+
+
+def test_filter_vectors_matches_brute_force():
+    rng = np.random.RandomState(1)
+    beliefs = simplex_grid(3, 200)
+    for trial in range(10):
+        vectors = rng.uniform(-10, 10, size=(12, 3))
+        kept = ValueIteration.filter_vectors(vectors)
+        values = np.dot(beliefs, vectors.T)
+        # The same value function, and every vector that is the best somewhere on the grid is kept
+        assert np.allclose(values.max(axis=1), values[:, kept].max(axis=1))
+        assert set(np.unique(np.argmax(values, axis=1))) <= set(kept)
+        # No kept vector can be removed without changing the value function
+        for n in kept:
+            others = [m for m in kept if m != n]
+            assert np.any(values[:, n] > values[:, others].max(axis=1) + 1e-9)
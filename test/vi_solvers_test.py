@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('solver', ['ValueIteration', 'IncrementalPruning'])
+def test_vi_tiger(solver):
+    """
+    Solve Tiger with vi.py end to end, for each exact value iteration solver
+    """
+    result = subprocess.run([sys.executable, 'vi.py', '--env', 'Tiger', '--solver', solver, '--planning_horizon', '3'],
+                            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True,
+                            timeout=600)
+    assert result.returncode == 0, result.stdout
+    assert 'ave undiscounted return/step' in result.stdout
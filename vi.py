@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 from __future__ import print_function
 from pomdpy import Agent
-from pomdpy.solvers import ValueIteration
+from pomdpy.solvers import ValueIteration, IncrementalPruning
 from pomdpy.log import init_logger
 from examples.tiger import TigerModel
 import argparse
@@ -12,7 +12,7 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Set the run parameters.')
     parser.add_argument('--env', type=str, help='Specify the env to solve {Tiger}')
     parser.add_argument('--solver', type=str,
-                        help='Specify the solver to use {ValueIteration|LinearAlphaNet|VI-Baseline}')
+                        help='Specify the solver to use {ValueIteration|IncrementalPruning|LinearAlphaNet|VI-Baseline}')
     parser.add_argument('--seed', default=1993, type=int, help='Specify the random seed for numpy.random')
     parser.add_argument('--use_tf', dest='use_tf', action='store_true', help='Set if using TensorFlow')
     parser.add_argument('--discount', default=0.95, type=float, help='Specify the discount factor (default=0.95)')
@@ -54,6 +54,8 @@ if __name__ == '__main__':
     else:
         if args['solver'] == 'ValueIteration':
             solver = ValueIteration
+        elif args['solver'] == 'IncrementalPruning':
+            solver = IncrementalPruning
         elif args['use_tf'] and args['solver'] == 'LinearAlphaNet':
             from pomdpy.solvers.linear_alpha_net import LinearAlphaNet
             solver = LinearAlphaNet